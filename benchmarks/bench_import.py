@@ -0,0 +1,88 @@
+"""
+Import cost of every console entry point in pyproject.toml.
+
+    python benchmarks/bench_import.py --repeat 5
+
+For each [project.scripts] entry, imports its module in a fresh interpreter
+(best of --repeat runs) and reports wall time, the slowest top-level imports
+from `python -X importtime`, and which heavy optional backends got loaded.
+A plan over .txt files should need none of the extractor or ML backends.
+"""
+from __future__ import annotations
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ["fitz", "PIL", "pytesseract", "docx", "openpyxl", "chardet",
+         "joblib", "numpy", "scipy", "sklearn", "rapidfuzz", "rich", "fastapi", "watchdog"]
+
+PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+print(dt)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def entry_points() -> dict[str, str]:
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    data = tomllib.loads((ROOT / "pyproject.toml").read_text(encoding="utf-8"))
+    return {name: target.split(":")[0] for name, target in data["project"]["scripts"].items()}
+
+
+def probe(module: str) -> tuple[float, list[str], str]:
+    proc = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return float("nan"), [], proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"
+    dt, loaded = proc.stdout.splitlines()[-2:]   # loaded may be an empty line
+    return float(dt), [m for m in loaded.split(",") if m], ""
+
+
+def slowest(module: str, n: int) -> list[tuple[int, str]]:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # " " + two spaces per nesting level; level 1 = direct imports of the package chain
+        if name.startswith("   ") and not name.startswith("     "):
+            rows.append((int(parts[1]), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=5)
+    args = ap.parse_args()
+
+    t_all = time.perf_counter()
+    for script, module in entry_points().items():
+        runs = [probe(module) for _ in range(args.repeat)]
+        best = min(r[0] for r in runs)
+        loaded, err = runs[-1][1], runs[-1][2]
+        print(f"{script:13s} {module:42s} {1000 * best:8.1f} ms")
+        if err:
+            print(f"    import failed: {err}")
+            continue
+        print(f"    heavy modules loaded: {', '.join(loaded) or 'none'}")
+        for us, name in slowest(module, args.top):
+            print(f"    {us / 1000:8.1f} ms  {name}")
+    print(f"total benchmark time {time.perf_counter() - t_all:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Model artifact: TF-IDF pipeline pickle vs. compact hashing/mmap artifact.
+
+    python benchmarks/bench_model.py --docs 3000 --classes 8
+
+Trains both formats on a synthetic labelled corpus and reports file size,
+cold load time (plain and mmap_mode="r"), single-document and batched
+prediction latency, and how often the two models agree.
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+import joblib
+
+from nas_file_organizer.ml.train import fit_model, save_model
+
+
+def make_corpus(n_docs: int, n_classes: int, words: int, seed: int = 42) -> tuple[list[str], list[str]]:
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(20000)]
+    cues = {f"label{c}": rng.sample(vocab, 40) for c in range(n_classes)}
+    texts, labels = [], []
+    for _ in range(n_docs):
+        label = rng.choice(list(cues))
+        toks = [rng.choice(vocab) for _ in range(words)]
+        toks += [rng.choice(cues[label]) for _ in range(words // 20)]
+        rng.shuffle(toks)
+        texts.append(" ".join(toks))
+        labels.append(label)
+    return texts, labels
+
+
+def time_load(path: str, mmap_mode: str | None, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        joblib.load(path, mmap_mode=mmap_mode)["pipeline"]
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def time_predict(model, texts: list[str]) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    for t in texts:
+        model.predict_proba([t])
+    single = (time.perf_counter() - t0) / len(texts)
+    t0 = time.perf_counter()
+    model.predict_proba(texts)
+    batch = (time.perf_counter() - t0) / len(texts)
+    return single, batch
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=3000)
+    ap.add_argument("--classes", type=int, default=8)
+    ap.add_argument("--words", type=int, default=400)
+    ap.add_argument("--prune", type=float, default=0.05)
+    args = ap.parse_args()
+
+    texts, labels = make_corpus(args.docs, args.classes, args.words)
+    probe = texts[:200]
+    tmp = tempfile.mkdtemp()
+    print(f"corpus: {len(texts)} docs x {args.words} words, {args.classes} classes")
+
+    models = {}
+    for name in ("pipeline", "compact"):
+        t0 = time.perf_counter()
+        model = fit_model(texts, labels, fmt=name, prune=args.prune)
+        fit_s = time.perf_counter() - t0
+        path = os.path.join(tmp, f"{name}.pkl")
+        save_model({"pipeline": model, "format": name}, path)
+        models[name] = joblib.load(path, mmap_mode="r")["pipeline"]
+        single, batch = time_predict(models[name], probe)
+        print(f"{name:9s}: size {os.path.getsize(path) / 2**20:7.2f} MiB  fit {fit_s:6.2f}s  "
+              f"load {1000 * time_load(path, None):7.1f} ms  load(mmap) {1000 * time_load(path, 'r'):7.1f} ms  "
+              f"predict {1000 * single:6.2f} ms/doc single, {1000 * batch:6.2f} ms/doc batched")
+
+    a = models["pipeline"].predict(probe)
+    b = models["compact"].predict(probe)
+    print(f"agreement: {sum(x == y for x, y in zip(a, b))}/{len(probe)} probe docs "
+          f"(compact keeps {len(models['compact'].features)} features)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 from __future__ import annotations
 import argparse
 from pathlib import Path
-from rich.console import Console
-from ..core.services import OrganizerService
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(prog="nas-organize", description="NAS File Organizer")
@@ -10,36 +8,77 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--execute", action="store_true", help="Execute moves (otherwise plan only)")
     p.add_argument("--dry-run", type=str, choices=["true","false"], help="Override dry_run from config")
     p.add_argument("--trace", action="store_true", help="Print rule scores for debugging")
+    p.add_argument("--workers", type=int, help="Override defaults.workers (parallel text extraction)")
+    p.add_argument("--cache-gc", action="store_true", help="Prune and compact the text cache, then exit")
+    p.add_argument("--plan-out", metavar="FILE", help="Also save the plan to FILE (JSON lines) for review or a later --from-plan")
+    p.add_argument("--from-plan", metavar="FILE", help="Use the plan saved in FILE instead of planning the inbox again")
+    p.add_argument("--force", action="store_true", help="With --from-plan: apply a plan made for another inbox or rules file")
     return p.parse_args()
 
 def main():
     args = parse_args()
+    # imported after argument parsing so --help and usage errors stay instant
+    from rich.console import Console
+    from ..core.services import OrganizerService
+    from ..core.cache import default_cache
+    from ..core.runs import exclusive_run
+    from ..core.planfile import plan_mismatches, read_plan, read_plan_header, save_plan
     console = Console()
+    if args.cache_gc:
+        res = default_cache().gc(full_vacuum=True)   # may VACUUM the whole DB once
+        console.print(f"[green]Cache GC:[/] reclaimed {res['bytes_reclaimed']} bytes  {res}")
+        return
     svc = OrganizerService()
     svc.trace = args.trace
     cfg_path = Path(args.config)
     opts = svc.load_options(cfg_path)
     if args.dry_run is not None:
         opts.dry_run = (args.dry_run.lower() == "true")
+    if args.workers is not None:
+        opts.workers = args.workers
 
-    console.rule(f"[bold green]Plan ({cfg_path})")
-    planned = list(svc.plan(opts))
+    if args.from_plan:
+        console.rule(f"[bold green]Plan ({args.from_plan})")
+        problems = plan_mismatches(read_plan_header(Path(args.from_plan)), opts.inbox, cfg_path)
+        for msg in problems:
+            console.print(f"[red]{'Warning' if args.force else 'Refusing plan'}:[/] {msg}")
+        if problems and not args.force:
+            console.print("[dim]re-plan, or pass --force to apply it anyway[/]")
+            raise SystemExit(2)
+        planned = list(read_plan(Path(args.from_plan)))
+    else:
+        console.rule(f"[bold green]Plan ({cfg_path})")
+        planned = list(svc.plan(opts))
+    if args.plan_out:
+        n = save_plan(planned, Path(args.plan_out), opts.inbox, cfg_path)
+        console.print(f"[dim]saved {n} planned files to {args.plan_out}[/]")
     for r in planned[:200]:
         if r.dst:
             console.print(f"[cyan]{r.src.name}[/] -> [green]{r.dst}[/]  (rule: {r.rule})")
         else:
             console.print(f"[yellow]{r.src.name}[/] -> [dim]no match[/]")
+    if args.trace:
+        console.print(f"[dim]rule evaluations: {dict(svc.rule_stats)}[/]")
 
     if args.execute or (console.input("\nProceed (y/N)? ").strip().lower() == "y"):
         console.rule("[bold green]Execute")
         opts.dry_run = False
-        for r in svc.execute(opts):
-            if r.ok and r.dst:
-                console.print(f"[green]Moved:[/] {r.src.name} -> {r.dst.name}")
-            elif r.reason == "no_match":
-                console.print(f"[yellow]Skipped:[/] {r.src.name} (no match)")
-            else:
-                console.print(f"[red]Error:[/] {r.src.name} -> {r.reason}")
+        waiting = lambda active: console.print(f"[yellow]Another run ({active}) is organizing this inbox; waiting…[/]")
+        # the plan was made before queueing, so this run only covers those files: a "paths"
+        # run, which never absorbs (or merges into) whole-inbox requests
+        with exclusive_run(opts.inbox, "cli", scope="paths", on_wait=waiting) as (coord, run):
+            # apply the plan shown above; files are only re-checked by fingerprint, not re-extracted
+            for r in coord.track(run, svc.execute_plan(planned, opts)):
+                if r.ok and r.dst:
+                    console.print(f"[green]Moved:[/] {r.src.name} -> {r.dst.name}")
+                elif r.reason == "no_match":
+                    console.print(f"[yellow]Skipped:[/] {r.src.name} (no match)")
+                elif (r.reason or "").startswith("stale_plan"):
+                    console.print(f"[yellow]Skipped:[/] {r.src.name} ({r.reason})")
+                else:
+                    console.print(f"[red]Error:[/] {r.src.name} -> {r.reason}")
+        console.print(f"[dim]run {run.id}: {run.files} files, {run.moved} moved, {run.errors} errors, "
+                      f"{run.files_per_sec} files/s[/]")
 
 if __name__ == "__main__":
     main()
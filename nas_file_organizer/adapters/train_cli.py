@@ -1,14 +1,22 @@
 import os, sys, json, argparse
-from nas_file_organizer.ml.train import train_and_save
 
 def main(argv=None):
     p = argparse.ArgumentParser(prog="nas-train", description="Retrain NAS model")
     p.add_argument("--db", default=os.getenv("CACHE_DB", "/data/cache.db"))
     p.add_argument("--out", default=os.getenv("MODEL_OUT", "/data/model.pkl"))
     p.add_argument("--version", default=os.getenv("MODEL_VERSION", "tfidf-logreg-v1"))
+    p.add_argument("--compact", action="store_true",
+                   default=os.getenv("MODEL_COMPACT", "0").lower() in ("1", "true", "yes"))
+    p.add_argument("--prune", type=float, default=float(os.getenv("MODEL_PRUNE", "0.05")))
+    p.add_argument("--incremental", action="store_true",
+                   default=os.getenv("MODEL_INCREMENTAL", "0").lower() in ("1", "true", "yes"))
+    p.add_argument("--full", action="store_true", help="force a full refit in incremental mode")
+    p.add_argument("--class-cap", type=int, default=int(os.getenv("MODEL_CLASS_CAP", "0")))
     args = p.parse_args(argv)
+    from nas_file_organizer.ml.train import train_and_save  # scikit-learn; not needed for --help
 
-    metrics = train_and_save(args.db, args.out, args.version)
+    metrics = train_and_save(args.db, args.out, args.version, compact=args.compact, prune=args.prune,
+                             incremental=args.incremental, full=args.full, per_class_cap=args.class_cap)
     print(json.dumps(metrics or {}, indent=2))
 
 if __name__ == "__main__":
@@ -1,74 +1,148 @@
 from __future__ import annotations
+import os
+import threading
 import time
+from collections import deque
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict
+from typing import Deque, Dict, Optional, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 
 from ..core.services import OrganizerService
+from ..core.models import Options
+from ..core.runs import LeaseLost, exclusive_run
 
 SETTLE_SECONDS = 2.0   # wait this long after last change
-STABILITY_CHECKS = 2   # require this many stable size checks (1 sec apart)
-
-def is_file_ready(p: Path) -> bool:
-    """Return True if file exists and size stops changing for STABILITY_CHECKS checks."""
-    if not p.exists() or p.is_dir():
-        return False
-    last = -1
-    for _ in range(STABILITY_CHECKS):
-        try:
-            sz = p.stat().st_size
-        except Exception:
-            return False
-        if sz == last:
-            continue
-        last = sz
-        time.sleep(1.0)
-    return True
+TICK_SECONDS = 0.5     # how often pending files are re-checked
+STABLE_TICKS = 2       # (size, mtime) must be unchanged for this many consecutive ticks
+
+@dataclass
+class Pending:
+    first_seen: float                       # first event for this path (latency starts here)
+    last_event: float
+    sig: Optional[Tuple[int, int]] = None   # (size, mtime_ns) at the previous tick
+    stable: int = 0                         # consecutive ticks with an unchanged sig
 
 class DebouncedHandler(FileSystemEventHandler):
+    """
+    Collects watchdog events into a pending map (from the observer thread) and,
+    once per tick, stats every pending file once. A file is ready when it has
+    been quiet for SETTLE_SECONDS and its (size, mtime) held for STABLE_TICKS
+    ticks; nothing sleeps per file.
+    """
+
     def __init__(self, rules_path: Path):
         self.rules_path = rules_path
-        self.last_seen: Dict[Path, float] = {}
+        self.pending: Dict[Path, Pending] = {}
+        self.latencies: Deque[float] = deque(maxlen=1000)   # drop -> processed, seconds
+        self._lock = threading.Lock()
         self.svc = OrganizerService()
+        self._opts: Optional[Options] = None
+        self._rules_mtime: Optional[int] = None
 
     def on_created(self, event: FileSystemEvent):
-        self._mark(event)
+        self._mark(event.src_path, event)
 
     def on_modified(self, event: FileSystemEvent):
-        self._mark(event)
+        self._mark(event.src_path, event)
+
+    def on_moved(self, event: FileSystemEvent):
+        # scanners/sync tools often write a temp file and rename it into place
+        self._mark(event.dest_path, event)
 
-    def _mark(self, event: FileSystemEvent):
+    def _mark(self, path: str | bytes, event: FileSystemEvent):
         if event.is_directory:
             return
-        p = Path(event.src_path)
-        self.last_seen[p] = time.time()
+        p = Path(os.fsdecode(path))   # watchdog types event paths as bytes | str
+        now = time.time()
+        with self._lock:
+            pend = self.pending.get(p)
+            if pend is None:
+                self.pending[p] = Pending(first_seen=now, last_event=now)
+            else:
+                pend.last_event = now
+                pend.stable = 0
+
+    def tick(self, now: Optional[float] = None) -> Dict[Path, Pending]:
+        """Re-check every pending file once; return (and un-track) the ones that are ready."""
+        now = now or time.time()
+        ready: Dict[Path, Pending] = {}
+        with self._lock:
+            items = list(self.pending.items())
+        for p, pend in items:
+            try:
+                st = p.stat()
+            except OSError:
+                with self._lock:
+                    self.pending.pop(p, None)   # gone (moved away, deleted, temp file)
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if sig == pend.sig:
+                pend.stable += 1
+            else:
+                pend.sig, pend.stable = sig, 0
+            if pend.stable >= STABLE_TICKS and (now - pend.last_event) >= SETTLE_SECONDS:
+                ready[p] = pend
+        with self._lock:
+            for p in ready:
+                self.pending.pop(p, None)
+        return ready
+
+    def options(self) -> Options:
+        """Current options; rules.yaml is only re-parsed when its mtime changes."""
+        mtime = self.rules_path.stat().st_mtime_ns
+        if self._opts is None or mtime != self._rules_mtime:
+            self._opts = self.svc.load_options(self.rules_path)
+            self._rules_mtime = mtime
+        return self._opts
 
     def flush_ready(self):
         """
-        Run when some files have settled. This reloads rules and executes the normal pipeline.
-        We don't individually move only changed files—running execute() is simpler and robust.
+        Run once per tick: plan and move exactly the files that have settled,
+        not the whole inbox. Files a batch did not get to (lost lease, error)
+        go back to pending and are retried once they settle again.
         """
-        if not self.last_seen:
+        if not self.pending:
             return
-
-        now = time.time()
-        # Pick files that have been quiet long enough AND are stable on disk
-        ready = [p for p, t in list(self.last_seen.items())
-                 if (now - t) >= SETTLE_SECONDS and is_file_ready(p)]
-
+        ready = self.tick()
         if not ready:
             return
 
-        # Remove them from the pending map first (avoid reprocessing loop)
-        for p in ready:
-            self.last_seen.pop(p, None)
+        done: set[Path] = set()
+        waiting = lambda active: print(f"[watch] Inbox busy with run {active}; waiting")
+        try:
+            # We execute with whatever dry_run is in rules.yaml
+            opts = self.options()
+            with exclusive_run(opts.inbox, "watch", scope="paths", on_wait=waiting) as (coord, run):
+                for r in coord.track(run, self.svc.process_paths(list(ready), opts)):
+                    done.add(r.src)
+        except LeaseLost as e:
+            # another run took the inbox over; it may be paths-scoped and never see these files
+            self._requeue(ready, done)
+            print(f"[watch] {e}; {len(ready) - len(done)} file(s) requeued")
+            return
+        except Exception as e:
+            self._requeue(ready, done)
+            print(f"[watch] Batch failed ({type(e).__name__}: {e}); {len(ready) - len(done)} file(s) requeued")
+            return
+
+        now = time.time()
+        lat = sorted(now - pend.first_seen for pend in ready.values())
+        self.latencies.extend(lat)
+        print(f"[watch] Processed {len(ready)} file(s); drop->archive latency "
+              f"p50={lat[len(lat) // 2]:.1f}s max={lat[-1]:.1f}s")
 
-        # Execute a batch pass (rules reloaded each time so edits are picked up)
-        opts = self.svc.load_options(self.rules_path)
-        # We execute with whatever dry_run is in rules.yaml
-        for _ in self.svc.execute(opts):
-            pass
+    def _requeue(self, ready: Dict[Path, Pending], done: set[Path]) -> None:
+        now = time.time()
+        with self._lock:
+            for p, pend in ready.items():
+                if p in done:
+                    continue
+                # settle again before the retry, so a failing batch doesn't spin every tick;
+                # an entry re-created by a newer event wins
+                pend.last_event, pend.stable = now, 0
+                self.pending.setdefault(p, pend)
 
 def main():
     rules_path = Path("rules.yaml")
@@ -84,7 +158,7 @@ def main():
     try:
         while True:
             handler.flush_ready()
-            time.sleep(0.5)
+            time.sleep(TICK_SECONDS)
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
@@ -1,12 +1,14 @@
 # nas_file_organizer/adapters/web.py
 from __future__ import annotations
+import time
+_T0 = time.monotonic()  # cold-start clock: everything below, incl. imports, counts
 from pathlib import Path
 from typing import List
-from fastapi import FastAPI, Request, BackgroundTasks, Form
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse
+from fastapi import FastAPI, Request, Form
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import sqlite3, os, datetime, json
+import asyncio, sqlite3, os, datetime, json, threading
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
@@ -14,18 +16,26 @@ from contextlib import asynccontextmanager
 
 from ..core.services import OrganizerService
 from ..core.models import Result, Options
+from ..core.cache import default_cache
+from ..core.runs import RunCoordinator, exclusive_run
+from ..core.samples import default_sample_writer
 from ..db.migrate import run as run_migrations
 from nas_file_organizer.web.review_router import router as review_router
-from nas_file_organizer.ml.train import train_and_save
+from nas_file_organizer.ml.holder import default_holder
+from nas_file_organizer.web.jobs import jobs, start_retrain
+from nas_file_organizer.web.planner import Planner, PLAN_REFRESH_SECONDS
 from nas_file_organizer.web.metrics import latest_metrics, per_class_counts
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    run_migrations()  # idempotent
+    # Startup: bind right away; migrations, model load and retrain check run in the background
+    _boot["startup_ms"] = round((time.monotonic() - _T0) * 1000)
+    print(f"[Startup] Serving after {_boot['startup_ms']} ms; startup tasks continue in the background")
+    threading.Thread(target=_startup_tasks, name="startup", daemon=True).start()
     yield
-    # Shutdown: nothing needed
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
 
 # ===== Env / paths =====
 APP_ROOT = Path(__file__).resolve().parents[2]
@@ -60,6 +70,20 @@ JOB_ID = "weekly_retrain"
 def _load_opts() -> Options:
     return svc.load_options(RULES_PATH)
 
+# cached dashboard plan, refreshed in the background (see web/planner.py)
+planner = Planner(_load_opts, RULES_PATH)
+
+def _plan_status() -> dict:
+    snap = planner.snapshot()
+    job = jobs.active("plan")
+    age = snap.age_seconds()
+    return {"built_at": (datetime.datetime.fromtimestamp(snap.built_at).isoformat(timespec="seconds")
+                         if snap.built_at else None),
+            "age_seconds": None if age is None else round(age, 1),
+            "duration_s": snap.duration_s, "files": len(snap.results),
+            "planned": snap.planned, "reused": snap.reused, "removed": snap.removed,
+            "refreshing": job is not None, "progress": job.progress if job else ""}
+
 def _tail(path: Path, lines: int = 200) -> str:
     if not path.exists():
         return ""
@@ -92,12 +116,6 @@ def _read_log_rows(limit: int = 300):
             rows.append(("", "", ln))
     return rows
 
-def _count_files(path: Path) -> int:
-    try:
-        return sum(1 for p in path.rglob("*") if p.is_file())
-    except Exception:
-        return 0
-
 def db():
     con = sqlite3.connect(CACHE_DB)
     con.row_factory = sqlite3.Row
@@ -142,11 +160,11 @@ def _set_schedule(day: str, hour: str):
     _set_setting("retrain_hour", hour)
 
 def _needs_retrain(db_path: str, days: int = 7) -> bool:
-    if not os.path.exists(db_path):
+    if not os.path.exists(db_path) or not os.path.exists(MODEL_OUT):
         return True
     try:
         con = sqlite3.connect(db_path)
-        row = con.execute("SELECT MAX(created_at) FROM ml_models").fetchone()
+        row = con.execute("SELECT MAX(trained_at) FROM ml_models").fetchone()
         con.close()
         if not row or not row[0]:
             return True
@@ -156,11 +174,8 @@ def _needs_retrain(db_path: str, days: int = 7) -> bool:
         return True
 
 def _do_retrain():
-    try:
-        res = train_and_save(CACHE_DB, MODEL_OUT, MODEL_VER)
-        print(f"[AutoRetrain] Model retrained ({res['samples']} samples, acc={res['accuracy']:.3f})")
-    except Exception as e:
-        print("[AutoRetrain] Retrain failed:", e)
+    # scheduled run; shares the single-flight retrain job with the button
+    start_retrain("scheduled")
 
 def _install_weekly_job():
     # Remove existing job (if any), then add a new one using current settings
@@ -183,6 +198,15 @@ def _install_weekly_job():
     scheduler.add_job(_do_retrain, trigger=trigger, id=JOB_ID)
     print(f"[AutoRetrain] Scheduled weekly retrain: {day} {h:02d}:00 ({SCHED_TZ})")
 
+def _cache_gc():
+    try:
+        res = default_cache().gc()
+        print(f"[CacheGC] Reclaimed {res['bytes_reclaimed']} bytes "
+              f"(missing={res['pruned_missing']}, aged={res['pruned_aged']}, evicted={res['evicted_lru']}, "
+              f"vacuum={res['vacuum']})")
+    except Exception as e:
+        print("[CacheGC] GC failed:", e)
+
 # ===== Routes (all local ones via app.add_api_route) =====
 
 # Create new top-level label folder
@@ -193,23 +217,41 @@ def _create_label(name: str = Form(...)):
 
 app.add_api_route("/review/labels/new", _create_label, methods=["POST"], name="create_label")
 
-# Manual retrain (button on review page)
-def _retrain():
-    train_and_save(CACHE_DB, MODEL_OUT, MODEL_VER)
-    return RedirectResponse(url="/review", status_code=303)
+# Background jobs (manual retrain lives in review_router: POST /review/retrain)
+@app.post("/api/jobs/retrain")
+def _api_retrain():
+    job, created = start_retrain("api")
+    return JSONResponse({**job.to_dict(), "created": created}, status_code=202)
+
+@app.get("/api/jobs")
+def _api_jobs():
+    return JSONResponse([j.to_dict() for j in jobs.list()])
+
+# Organize runs from every process (web, CLI, watcher) on this inbox, newest first
+@app.get("/api/runs")
+def _api_runs(limit: int = 50):
+    return JSONResponse(RunCoordinator(_load_opts().inbox).history(limit))
 
-app.add_api_route("/review/retrain", _retrain, methods=["POST"], name="retrain_model")
-app.add_api_route("/review/retrain", _retrain, methods=["GET"],  name="retrain_model_get")
+@app.get("/api/jobs/{job_id}")
+def _api_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return JSONResponse(job.to_dict())
 
 # Home/dashboard
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
     opts = _load_opts()
-    planned: List[Result] = list(svc.plan(opts))
+    snap = planner.snapshot()
+    if snap.built_at is None:
+        planner.request_refresh(trigger="dashboard")
+    planned: List[Result] = snap.results
     to_move = [r for r in planned if r.dst and r.reason != "no_match"]
     no_match = [r for r in planned if r.reason == "no_match"]
     review_candidates = [r for r in planned if r.reason == "review"]
     logs_tail = _tail(LOG_PATH, 150)
+    running = jobs.active("execute")
     reviews = _review_files(opts)
     return templates.TemplateResponse("index.html", {
         "request": request,
@@ -220,38 +262,129 @@ def home(request: Request):
         "count_move": len(to_move),
         "count_nomatch": len(no_match),
         "count_review": len(review_candidates) or len(reviews),
-        "inbox_count": _count_files(opts.inbox),
+        "inbox_count": snap.files,       # from the planner's last scan; no walk per page load
         "log_tail": logs_tail,
         "reviews": [str(p.relative_to(opts.archive_root)) for p in reviews][:50],
+        "readiness": _readiness(),
+        "plan_status": _plan_status(),
+        "execute_job": request.query_params.get("execute_job") or (running.id if running else None),
     })
 
+# Replan the whole inbox (ignores the snapshot's per-file reuse)
+@app.post("/plan/recompute")
+def plan_recompute():
+    planner.request_refresh(full=True, trigger="manual")
+    return RedirectResponse(url="/", status_code=303)
+
+def _result_dict(r: Result) -> dict:
+    return {
+        "src": str(r.src),
+        "dst": (str(r.dst) if r.dst else None),
+        "rule": r.rule,
+        "reason": r.reason,
+        "ok": r.ok,
+    }
+
+# errors kept on an execute job's stats for the progress stream
+EXEC_KEEP_ERRORS = 20
+
+def _execute_task(job):
+    opts = _load_opts()
+    job.update_stats(done=0, moved=0, skipped=0, errors=0, files_per_sec=0.0,
+                     current=None, recent_errors=[], run_id=None)
+
+    def waiting(active_run: str):
+        job.progress = f"waiting for run {active_run} (CLI, watcher or another execute) to finish"
+
+    with exclusive_run(opts.inbox, "web", on_wait=waiting) as (coord, run):
+        job.update_stats(run_id=run.id)
+        if not run.active:
+            job.progress = f"merged into queued run {run.merged_into}"
+            return {"run_id": run.id, "merged_into": run.merged_into}
+        # execute what the dashboard planned: bring the snapshot up to date (only new or
+        # changed files are planned), then apply it with a fingerprint re-check per file
+        job.progress = "updating plan"
+        planner.refresh(job=job)
+        planned = planner.snapshot().results
+        # own service instance: the dashboard's svc may be planning concurrently
+        _execute_tracked(job, coord.track(run, OrganizerService().execute_plan(planned, opts)))
+    return {k: v for k, v in job.stats.items() if k != "current"}
+
+def _execute_tracked(job, results):
+    # counted in a local dict and published per file; recent_errors is rebuilt, never appended to
+    st = dict(job.stats)
+    t0 = time.monotonic()
+    try:
+        for r in results:
+            st["done"] += 1
+            st["current"] = str(r.src)
+            if not r.ok:
+                st["errors"] += 1
+                st["recent_errors"] = (st["recent_errors"] + [{"src": str(r.src), "error": r.reason}])[-EXEC_KEEP_ERRORS:]
+            elif r.dst and r.reason != "no_match":
+                st["moved"] += 1
+            else:
+                st["skipped"] += 1
+            st["files_per_sec"] = round(st["done"] / max(time.monotonic() - t0, 1e-6), 2)
+            job.update_stats(**st)
+            job.progress = f"{st['done']} files, {st['errors']} errors"
+    finally:
+        job.update_stats(current=None)
+        planner.request_refresh(trigger="execute")
+
 # Run plan/execute from UI
 @app.post("/run")
-def run(background_tasks: BackgroundTasks, mode: str = Form("plan")):
-    opts = _load_opts()
+def run(mode: str = Form("plan")):
     if mode == "execute":
-        def _do():
-            for _ in svc.execute(opts):
-                pass
-        background_tasks.add_task(_do)
-        return RedirectResponse(url="/", status_code=303)
+        job, _ = jobs.submit("execute", _execute_task, trigger="manual")
+        return RedirectResponse(url=f"/?execute_job={job.id}", status_code=303)
     else:
         return RedirectResponse(url="/", status_code=303)
 
-# API: plan JSON
+# Server-Sent Events: one "progress" event per change of a job's state, then "done"
+@app.get("/api/jobs/{job_id}/events")
+async def _api_job_events(job_id: str, request: Request):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+
+    async def events():
+        last = None
+        while True:
+            active = job.active   # read before the snapshot so the final state is always sent
+            payload = json.dumps(job.to_dict())
+            if payload != last:
+                last = payload
+                yield f"event: {'progress' if active else 'done'}\ndata: {payload}\n\n"
+            if not active or await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _plan_stream():
+    # bring the planner's snapshot up to date (only new/changed files are planned, and the
+    # planner's lock serialises this with scheduled refreshes and execute), then stream it
+    planner.refresh()
+    for r in planner.snapshot().results:
+        yield json.dumps(_result_dict(r)) + "\n"
+
+# API: plan JSON (from the snapshot; X-Plan-Age-Seconds says how old it is).
+# ?stream=1 refreshes the snapshot first and streams it as NDJSON.
 @app.get("/api/plan")
-def api_plan():
-    opts = _load_opts()
-    out = []
-    for r in svc.plan(opts):
-        out.append({
-            "src": str(r.src),
-            "dst": (str(r.dst) if r.dst else None),
-            "rule": r.rule,
-            "reason": r.reason,
-            "ok": r.ok,
-        })
-    return JSONResponse(out)
+def api_plan(stream: bool = False):
+    if stream:
+        return StreamingResponse(_plan_stream(), media_type="application/x-ndjson")
+    out = [_result_dict(r) for r in planner.snapshot().results]
+    status = _plan_status()
+    return JSONResponse(out, headers={"X-Plan-Built-At": status["built_at"] or "",
+                                      "X-Plan-Age-Seconds": "" if status["age_seconds"] is None
+                                      else str(status["age_seconds"])})
+
+@app.get("/api/plan/status")
+def api_plan_status():
+    return JSONResponse(_plan_status())
 
 # Logs & History
 @app.get("/logs")
@@ -289,13 +422,80 @@ def _api_metrics_latest():
 
 app.add_api_route("/api/metrics/latest", _api_metrics_latest, methods=["GET"], name="api_metrics_latest")
 
-# ===== Startup actions =====
-if _needs_retrain(CACHE_DB, 7):
-    print("[AutoRetrain] Model is stale or missing → retraining now...")
-    _do_retrain()
+# In-process counters (text cache hit/miss/evictions, ...)
+@app.get("/api/metrics/runtime")
+def _api_metrics_runtime():
+    return JSONResponse({"text_cache": default_cache().snapshot_stats(),
+                         "model": default_holder().snapshot_stats(),
+                         "ml_samples": default_sample_writer().snapshot_stats()})
+
+# ===== Startup (background) & readiness =====
+_state = {"migrations": "pending", "model": "pending", "scheduler": "pending"}
+_boot = {"import_ms": round((time.monotonic() - _T0) * 1000), "startup_ms": None,
+         "first_response_ms": None, "ready_ms": None}
 
-scheduler.start()
-_install_weekly_job()
+def _startup_tasks():
+    try:
+        run_migrations()  # idempotent
+        _state["migrations"] = "done"
+    except Exception as e:
+        _state["migrations"] = f"failed: {e}"
+        print("[Startup] Migrations failed:", e)
+
+    try:
+        scheduler.start()
+        _install_weekly_job()
+        scheduler.add_job(_cache_gc, trigger=CronTrigger(hour=4, minute=30), id="cache_gc", replace_existing=True)
+        if PLAN_REFRESH_SECONDS > 0:
+            scheduler.add_job(planner.request_refresh, trigger="interval", seconds=PLAN_REFRESH_SECONDS,
+                              id="plan_refresh", replace_existing=True)
+        _state["scheduler"] = "running"
+    except Exception as e:
+        _state["scheduler"] = f"failed: {e}"
+        print("[Startup] Scheduler failed:", e)
+
+    if _needs_retrain(CACHE_DB, 7):
+        print("[AutoRetrain] Model is stale or missing → retraining in the background...")
+        start_retrain("startup")
+
+    # warm the model so the first classification doesn't pay the unpickle
+    _state["model"] = "loading"
+    holder = default_holder()
+    holder.refresh()
+    _state["model"] = "ready" if holder.snapshot_stats()["version"] else "missing"
+    # first plan snapshot, planned with the model that is now loaded
+    planner.request_refresh(trigger="startup")
+    _boot["ready_ms"] = round((time.monotonic() - _T0) * 1000)
+    print(f"[Startup] Background startup finished after {_boot['ready_ms']} ms "
+          f"(model {_state['model']}, migrations {_state['migrations']})")
+
+def _readiness() -> dict:
+    retrain = jobs.active("retrain")
+    model = "ready" if default_holder().snapshot_stats()["version"] else _state["model"]
+    if _state["migrations"] == "pending":
+        phase = "starting"
+    elif model in ("pending", "loading"):
+        phase = "model loading"
+    elif retrain is not None:
+        phase = "retraining"
+    else:
+        phase = "ready"
+    return {"phase": phase, "ready": phase == "ready", **_state, "model": model,
+            "retrain": retrain.to_dict() if retrain else None, "boot": _boot}
+
+@app.middleware("http")
+async def _first_response_timer(request: Request, call_next):
+    response = await call_next(request)
+    if _boot["first_response_ms"] is None:
+        _boot["first_response_ms"] = round((time.monotonic() - _T0) * 1000)
+        print(f"[Startup] First response after {_boot['first_response_ms']} ms "
+              f"({request.method} {request.url.path})")
+    return response
+
+# Liveness + readiness: always 200 once the server is up; "ready" says whether the model is in
+@app.get("/api/health")
+def _api_health():
+    return JSONResponse({"status": "ok", **_readiness()})
 
 def main():
     import uvicorn
@@ -1,57 +1,439 @@
 from __future__ import annotations
 import hashlib
+import os
 import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
 from pathlib import Path
 from typing import Optional
 
 DB_PATH = Path("/data/cache.db")
+# in-process LRU in front of SQLite, bounded by total cached characters
+MEM_CHARS = int(float(os.environ.get("TEXT_CACHE_MEM_MB", "32")) * 1024 * 1024)
+
+# path: entries die with the path; content/content_full: entries follow the bytes across moves
+KEY_MODES = ("path", "content", "content_full")
+FP_BLOCK = 64 * 1024
+FP_MEMO = 8192
+SQL_BATCH = 500   # stays under SQLITE_MAX_VARIABLE_NUMBER on old builds
+
+# on-disk budget: compress texts above COMPRESS_MIN chars, evict least recently used rows
+COMPRESS = os.environ.get("TEXT_CACHE_COMPRESS", "1") != "0"
+COMPRESS_MIN = 512
+MAX_DB_BYTES = int(float(os.environ.get("TEXT_CACHE_MAX_MB", "1024")) * 1024 * 1024)   # cached text payload; 0 = unbounded
+MAX_AGE_DAYS = float(os.environ.get("TEXT_CACHE_MAX_AGE_DAYS", "180"))                  # 0 = keep forever
+CAP_CHECK_EVERY = 200   # writes between size-cap checks
+TOUCH_BATCH = 256       # pending atime updates flushed together
+VACUUM_PAGES = 1000     # pages released per incremental_vacuum step
+
+CODEC_PLAIN, CODEC_ZLIB = 0, 1
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS file_cache (
   key TEXT PRIMARY KEY,
-  text CLOB NOT NULL,
+  text CLOB NOT NULL,              -- str, or zlib'd utf-8 bytes when codec=1
   mtime REAL NOT NULL,
-  size INTEGER NOT NULL
+  size INTEGER NOT NULL,
+  codec INTEGER NOT NULL DEFAULT 0,
+  path TEXT,                       -- last path seen, for GC of deleted files
+  atime REAL,                      -- last read/write (unix time), for LRU/age eviction
+  nbytes INTEGER                   -- stored payload size
 );
 """
+# columns added after the first release; old cache.db files get them on open
+_ADDED_COLUMNS = {
+    "codec": "INTEGER NOT NULL DEFAULT 0",
+    "path": "TEXT",
+    "atime": "REAL",
+    "nbytes": "INTEGER",
+}
 
-def _connect() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("PRAGMA synchronous=NORMAL;")
-    con.execute(SCHEMA)
-    return con
+def _encode(text: str) -> tuple[str | bytes, int, int]:
+    if COMPRESS and len(text) >= COMPRESS_MIN:
+        raw = text.encode("utf-8")
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed, CODEC_ZLIB, len(packed)
+    return text, CODEC_PLAIN, len(text.encode("utf-8"))
 
-def make_key(path: Path) -> str:
-    st = path.stat()
+def _decode(payload: str | bytes, codec: int) -> str:
+    if isinstance(payload, str):
+        return payload
+    raw = zlib.decompress(payload) if codec == CODEC_ZLIB else payload
+    return raw.decode("utf-8")
+
+def make_key(path: Path, st: os.stat_result | None = None, resolved: str | None = None) -> str:
+    st = st or path.stat()
     h = hashlib.sha1()
     # path influences; size+mtime detect changes
-    h.update(str(path.resolve()).encode("utf-8"))
+    h.update((resolved or str(path.resolve())).encode("utf-8"))
     h.update(str(st.st_size).encode("utf-8"))
     h.update(str(st.st_mtime_ns).encode("utf-8"))
     return h.hexdigest()
 
-def get_text(path: Path) -> Optional[str]:
-    key = make_key(path)
-    st = path.stat()
-    with _connect() as con:
-        row = con.execute(
-            "SELECT text, mtime, size FROM file_cache WHERE key=?",
-            (key,)
-        ).fetchone()
-        if not row:
-            return None
-        text, mtime, size = row
-        # defensive sanity (should always match with our key scheme)
-        if abs(mtime - st.st_mtime) > 1 or size != st.st_size:
-            return None
-        return text
-
-def set_text(path: Path, text: str) -> None:
-    key = make_key(path)
-    st = path.stat()
-    with _connect() as con:
-        con.execute(
-            "INSERT OR REPLACE INTO file_cache(key, text, mtime, size) VALUES (?, ?, ?, ?)",
-            (key, text, st.st_mtime, st.st_size),
-        )
+def content_fingerprint(path: Path, st: os.stat_result | None = None, full: bool = False) -> str:
+    """
+    Content key for a file. Cheap mode hashes the size plus the first and last
+    FP_BLOCK bytes; full mode streams the whole file through BLAKE2b.
+    """
+    st = st or path.stat()
+    h = hashlib.blake2b(digest_size=20)
+    with path.open("rb") as f:
+        if full:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+            return "b2:" + h.hexdigest()
+        h.update(str(st.st_size).encode("utf-8"))
+        h.update(f.read(FP_BLOCK))
+        if st.st_size > FP_BLOCK:
+            f.seek(max(FP_BLOCK, st.st_size - FP_BLOCK))
+            h.update(f.read(FP_BLOCK))
+    return "fp:" + h.hexdigest()
+
+class TextCache:
+    """
+    Extracted-text cache: a bounded in-memory LRU keyed by (path, size, mtime_ns)
+    in front of the SQLite file_cache table.
+
+    One long-lived connection is shared by all threads behind a lock; the
+    pragmas and schema run once per process instead of once per lookup. The
+    lock covers only the LRU and SQLite work: content keys (which read the
+    file) are computed before it is taken, so one slow fingerprint doesn't
+    stall every other thread's lookups.
+    """
+
+    def __init__(self, db_path: Path | str = DB_PATH, mem_chars: int = MEM_CHARS):
+        self.db_path = Path(db_path)
+        self.mem_chars = mem_chars
+        self.stats: Counter[str] = Counter()
+        self._lock = threading.RLock()
+        self._con: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lru: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+        self._lru_chars = 0
+        self._fps: OrderedDict[tuple[str, int, int, bool], str] = OrderedDict()
+        self._touched: dict[str, float] = {}
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection inherited through fork (extraction pool) must not be reused
+        if self._con is None or self._pid != os.getpid():
+            con = sqlite3.connect(self.db_path, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            con.execute(SCHEMA)
+            have = {r[1] for r in con.execute("PRAGMA table_info(file_cache)")}
+            for col, ddl in _ADDED_COLUMNS.items():
+                if col not in have:
+                    con.execute(f"ALTER TABLE file_cache ADD COLUMN {col} {ddl}")
+            if "atime" not in have:
+                # legacy rows start their eviction clock now
+                con.execute("UPDATE file_cache SET atime=? WHERE atime IS NULL", (time.time(),))
+            con.execute("CREATE INDEX IF NOT EXISTS idx_file_cache_atime ON file_cache(atime)")
+            con.commit()
+            self._con, self._pid = con, os.getpid()
+        return self._con
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None and self._pid == os.getpid():
+                self._flush_touches()
+                self._con.close()
+            self._con = None
+
+    def _touch(self, key: str) -> None:
+        # atime writes are batched so warm reads don't turn into one write each
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touches()
+
+    def _flush_touches(self) -> None:
+        if not self._touched:
+            return
+        con = self._connect()
+        con.executemany("UPDATE file_cache SET atime=? WHERE key=?",
+                        [(t, k) for k, t in self._touched.items()])
+        con.commit()
+        self._touched.clear()
+
+    def _remember(self, mkey: tuple[str, int, int], text: str) -> None:
+        if len(text) > self.mem_chars:
+            return
+        old = self._lru.pop(mkey, None)
+        if old is not None:
+            self._lru_chars -= len(old)
+        self._lru[mkey] = text
+        self._lru_chars += len(text)
+        while self._lru_chars > self.mem_chars:
+            _, dropped = self._lru.popitem(last=False)
+            self._lru_chars -= len(dropped)
+            self.stats["evictions"] += 1
+
+    def content_key(self, path: Path, st: os.stat_result | None = None, full: bool = False,
+                    resolved: str | None = None) -> str:
+        """content_fingerprint(), memoized per (path, size, mtime_ns) so a scan hashes each file once."""
+        st = st or path.stat()
+        fkey = (resolved or str(path.resolve()), st.st_size, st.st_mtime_ns, full)
+        with self._lock:
+            fp = self._fps.get(fkey)
+        if fp is None:
+            fp = content_fingerprint(path, st, full)
+            with self._lock:
+                self._fps[fkey] = fp
+                if len(self._fps) > FP_MEMO:
+                    self._fps.popitem(last=False)
+        return fp
+
+    def key_for(self, path: Path, st: os.stat_result, resolved: str, key_mode: str = "path") -> str:
+        if key_mode == "path":
+            return make_key(path, st, resolved)
+        if key_mode not in KEY_MODES:
+            raise ValueError(f'cache key mode must be one of {", ".join(KEY_MODES)}, not "{key_mode}".')
+        return self.content_key(path, st, key_mode == "content_full", resolved)
+
+    def get(self, path: Path, st: os.stat_result | None = None, key_mode: str = "path") -> Optional[str]:
+        st = st or path.stat()
+        resolved = str(path.resolve())
+        mkey = (resolved, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            text = self._lru.get(mkey)
+            if text is not None:
+                self._lru.move_to_end(mkey)
+                self.stats["hits"] += 1
+                self.stats["mem_hits"] += 1
+                return text
+
+        key = self.key_for(path, st, resolved, key_mode)   # may hash the file: outside the lock
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT text, mtime, size, codec FROM file_cache WHERE key=?", (key,)
+            ).fetchone()
+            # defensive sanity (should always match with our key scheme);
+            # content keys legitimately outlive the mtime (copies, touch)
+            if not row or row[2] != st.st_size or (key_mode == "path" and abs(row[1] - st.st_mtime) > 1):
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            text = _decode(row[0], row[3])
+            self._touch(key)
+            self._remember(mkey, text)
+            return text
+
+    def get_many(self, items: list[tuple[Path, os.stat_result]], key_mode: str = "path") -> dict[Path, str]:
+        """
+        Bulk get() for a whole scan: LRU first, then the remaining keys in a few
+        batched IN (...) queries. Returns only the hits.
+        """
+        out: dict[Path, str] = {}
+        misses: list[tuple[Path, os.stat_result, str, tuple[str, int, int]]] = []
+        with self._lock:
+            for path, st in items:
+                resolved = str(path.resolve())
+                mkey = (resolved, st.st_size, st.st_mtime_ns)
+                text = self._lru.get(mkey)
+                if text is not None:
+                    self._lru.move_to_end(mkey)
+                    self.stats["hits"] += 1
+                    self.stats["mem_hits"] += 1
+                    out[path] = text
+                else:
+                    misses.append((path, st, resolved, mkey))
+
+        # keys may hash file contents: computed without holding the lock
+        # identical files share a content key: one row fills every path that maps to it
+        pending: dict[str, list[tuple[Path, os.stat_result, tuple[str, int, int]]]] = {}
+        for path, st, resolved, mkey in misses:
+            try:
+                key = self.key_for(path, st, resolved, key_mode)
+            except OSError:
+                continue  # vanished/unreadable: let the extractor deal with it
+            pending.setdefault(key, []).append((path, st, mkey))
+        n_pending = sum(len(v) for v in pending.values())
+
+        with self._lock:
+            keys = list(pending)
+            found = 0
+            con = self._connect()
+            for i in range(0, len(keys), SQL_BATCH):
+                chunk = keys[i:i + SQL_BATCH]
+                rows = con.execute(
+                    f"SELECT key, text, mtime, size, codec FROM file_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, payload, mtime, size, codec in rows:
+                    text = None
+                    for path, st, mkey in pending[key]:
+                        if size != st.st_size or (key_mode == "path" and abs(mtime - st.st_mtime) > 1):
+                            continue
+                        if text is None:
+                            text = _decode(payload, codec)
+                            self._touch(key)
+                        out[path] = text
+                        found += 1
+                        self._remember(mkey, text)
+            self.stats["hits"] += found
+            self.stats["misses"] += n_pending - found
+        return out
+
+    def set(self, path: Path, text: str, st: os.stat_result | None = None, key_mode: str = "path") -> None:
+        st = st or path.stat()
+        resolved = str(path.resolve())
+        key = self.key_for(path, st, resolved, key_mode)
+        payload, codec, nbytes = _encode(text)
+        with self._lock:
+            con = self._connect()
+            con.execute(
+                "INSERT OR REPLACE INTO file_cache(key, text, mtime, size, codec, path, atime, nbytes)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, payload, st.st_mtime, st.st_size, codec, resolved, time.time(), nbytes),
+            )
+            con.commit()
+            self._remember((resolved, st.st_size, st.st_mtime_ns), text)
+            self._writes += 1
+            if MAX_DB_BYTES and self._writes % CAP_CHECK_EVERY == 0:
+                self._evict_to_cap(con)
+
+    # --- on-disk budget
+
+    @staticmethod
+    def _db_bytes(con: sqlite3.Connection) -> tuple[int, int]:
+        """(file bytes, bytes in use) of the whole database."""
+        page = con.execute("PRAGMA page_size").fetchone()[0]
+        pages = con.execute("PRAGMA page_count").fetchone()[0]
+        free = con.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages * page, (pages - free) * page
+
+    @staticmethod
+    def _payload_bytes(con: sqlite3.Connection) -> int:
+        """Stored text bytes in file_cache; the same DB file also holds ml_*, inbox_* and runs tables."""
+        return con.execute("SELECT COALESCE(SUM(COALESCE(nbytes, length(text))), 0) FROM file_cache").fetchone()[0]
+
+    def _delete_keys(self, con: sqlite3.Connection, keys: list[str]) -> None:
+        # one short transaction per batch, so other writers get the DB in between
+        for i in range(0, len(keys), SQL_BATCH):
+            chunk = keys[i:i + SQL_BATCH]
+            con.execute(f"DELETE FROM file_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            con.commit()
+
+    def _evict_to_cap(self, con: sqlite3.Connection) -> int:
+        """Drop least recently used rows until the cached texts fit MAX_DB_BYTES (with 10% headroom)."""
+        used = self._payload_bytes(con)
+        excess = used - int(MAX_DB_BYTES * 0.9)
+        if used <= MAX_DB_BYTES or excess <= 0:
+            return 0
+        self._flush_touches()
+        victims: list[str] = []
+        freed = 0
+        cur = con.execute("SELECT key, COALESCE(nbytes, length(text)) FROM file_cache ORDER BY atime")
+        for key, nbytes in cur:
+            victims.append(key)
+            freed += nbytes or 0
+            if freed >= excess:
+                break
+        cur.close()
+        self._delete_keys(con, victims)
+        self.stats["db_evictions"] += len(victims)
+        return len(victims)
+
+    def gc(self, full_vacuum: bool = False) -> dict:
+        """
+        Background maintenance pass: drop path-keyed rows whose file is gone,
+        rows idle for MAX_AGE_DAYS, then LRU rows over MAX_DB_BYTES, and give
+        the freed pages back with an incremental VACUUM. Content-keyed rows
+        are not tied to a path, so only age and size evict them.
+
+        Runs on its own connection in short transactions of SQL_BATCH rows;
+        the cache lock is only taken for the LRU eviction, so lookups and the
+        other writers of cache.db (run leases, sample log) keep going. A file
+        not yet in incremental auto_vacuum mode needs one full VACUUM to
+        switch; that blocks the whole DB, so only full_vacuum=True (the CLI's
+        --cache-gc) does it.
+        """
+        with self._lock:
+            self._connect()             # schema/columns in place
+            self._flush_touches()
+        con = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            size_before, _ = self._db_bytes(con)
+
+            # file checks (slow on a NAS) hold no lock; rows are read in pages and deleted in batches
+            gone = 0
+            last = ""
+            while True:
+                rows = con.execute("SELECT key, path FROM file_cache WHERE path IS NOT NULL AND key > ?"
+                                   " ORDER BY key LIMIT ?", (last, SQL_BATCH)).fetchall()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                missing = [k for k, path in rows
+                           if not k.startswith(("fp:", "b2:")) and not os.path.exists(path)]
+                self._delete_keys(con, missing)
+                gone += len(missing)
+
+            aged = 0
+            if MAX_AGE_DAYS:
+                cutoff = time.time() - MAX_AGE_DAYS * 86400
+                while True:
+                    n = con.execute("DELETE FROM file_cache WHERE key IN"
+                                    " (SELECT key FROM file_cache WHERE atime < ? LIMIT ?)",
+                                    (cutoff, SQL_BATCH)).rowcount
+                    con.commit()
+                    aged += n
+                    if n < SQL_BATCH:
+                        break
+
+            evicted = 0
+            if MAX_DB_BYTES:
+                with self._lock:
+                    evicted = self._evict_to_cap(self._connect())
+
+            vacuum = "incremental"
+            if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if full_vacuum:
+                    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    con.execute("VACUUM")
+                    vacuum = "full"
+                else:
+                    vacuum = "skipped (not in incremental mode; run nas-organize --cache-gc once)"
+            else:
+                while con.execute("PRAGMA freelist_count").fetchone()[0]:
+                    con.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+            con.commit()
+
+            size_after, _ = self._db_bytes(con)
+        finally:
+            con.close()
+        with self._lock:
+            self.stats["gc_runs"] += 1
+        return {
+            "pruned_missing": gone,
+            "pruned_aged": aged,
+            "evicted_lru": evicted,
+            "vacuum": vacuum,
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+            "bytes_reclaimed": max(0, size_before - size_after),
+        }
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "mem_entries": len(self._lru), "mem_chars": self._lru_chars}
+
+_default: TextCache | None = None
+_default_lock = threading.Lock()
+
+def default_cache() -> TextCache:
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = TextCache()
+    return _default
+
+def get_text(path: Path, st: os.stat_result | None = None, key_mode: str = "path") -> Optional[str]:
+    return default_cache().get(path, st, key_mode)
+
+def set_text(path: Path, text: str, st: os.stat_result | None = None, key_mode: str = "path") -> None:
+    default_cache().set(path, text, st, key_mode)
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import Optional, Pattern, Sequence, Tuple
+from rapidfuzz import fuzz, process
+from .models import Rule
+
+_END = None  # trie marker for "a keyword ends here"
+
+FUZZY_MODES = ("full", "windowed")
+
+
+def _trie_pattern(node: dict) -> str:
+    branches = [re.escape(ch) + _trie_pattern(child)
+                for ch, child in sorted((k, v) for k, v in node.items() if k is not _END)]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if _END in node:
+        # greedy optional: prefer the longer keyword, fall back to this one
+        return "(?:" + body + ")?"
+    return body
+
+
+class KeywordMatcher:
+    """
+    Find every keyword that occurs in a text with a single scan.
+
+    Keywords are folded into a trie and emitted as one regex, so the automaton
+    runs inside the C regex engine. A zero-width lookahead is tried at every
+    position and captures the longest keyword starting there; all shorter
+    keywords that are prefixes of it are implied. Together that gives the same
+    hit set as Aho-Corasick without a per-character Python loop.
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        kwset = set(self.keywords)
+        self._implied = {
+            k: [k[:j] for j in range(1, len(k) + 1) if k[:j] in kwset]
+            for k in self.keywords
+        }
+        trie: dict = {}
+        for k in self.keywords:
+            node = trie
+            for ch in k:
+                node = node.setdefault(ch, {})
+            node[_END] = True
+        self._rx = re.compile("(?=(" + _trie_pattern(trie) + "))") if self.keywords else None
+
+    def find(self, text: str) -> set[str]:
+        """Return the set of keywords occurring anywhere in text."""
+        hits: set[str] = set()
+        if self._rx is None or not text:
+            return hits
+        seen: set[str] = set()
+        for m in self._rx.finditer(text):
+            longest = m.group(1)
+            if longest in seen:
+                continue
+            seen.add(longest)
+            hits.update(self._implied[longest])
+            if len(hits) == len(self.keywords):
+                break
+        return hits
+
+
+@dataclass
+class TextScan:
+    """Per-document state shared by every rule: split, lowercased and keyword-scanned once."""
+    text: str
+    title: str                      # lowercased
+    body: str                       # lowercased
+    title_hits: set[str]
+    body_hits: set[str]
+    _lower: Optional[str] = field(default=None, repr=False)
+    _searched: dict = field(default_factory=dict, repr=False)
+    _windows: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    def search(self, rx: Pattern[str]) -> bool:
+        # rules often share patterns; re.compile hands back the same object for the same source
+        hit = self._searched.get(rx)
+        if hit is None:
+            hit = self._searched[rx] = rx.search(self.text) is not None
+        return hit
+
+    def windows(self, words: int, budget: int) -> list[str]:
+        """Distinct runs of `words` body tokens in document order, up to `budget` characters in total."""
+        key = (words, budget)
+        out = self._windows.get(key)
+        if out is None:
+            seen: dict[str, None] = {}
+            used = 0
+            tokens = self.body.split()
+            for i in range(max(0, len(tokens) - words + 1)):
+                w = " ".join(tokens[i:i + words])
+                if w in seen:
+                    continue
+                used += len(w)
+                if used > budget:
+                    break
+                seen[w] = None
+            out = self._windows[key] = list(seen)
+        return out
+
+
+@dataclass
+class CompiledRule:
+    rule: Rule
+    keywords: list[tuple[str, str]]          # (as written, lowercased)
+    patterns: list[Pattern[str]]
+    regex: Optional[Pattern[str]]
+
+
+def _compile(pat, flags: int = 0) -> Optional[Pattern[str]]:
+    try:
+        return re.compile(pat, flags)
+    except (re.error, TypeError):
+        # bad regex is ignored, same as when it was re.search'ed per file
+        return None
+
+
+def max_score(c: CompiledRule) -> float:
+    """
+    Highest score the rule could reach on any document. Terms are added in the
+    same order as score() adds them, so float rounding can't put a real score above it.
+    """
+    m = c.rule.match
+    bound = 0.0
+    for _ in c.keywords:
+        bound += max(m.title_weight, m.body_weight, 0.0)
+    if c.keywords and m.fuzzy_min:
+        bound += max(m.body_weight, 0.0)
+    for _ in c.patterns:
+        bound += 2.0
+    if c.regex is not None:
+        bound += max(m.body_weight, 0.0)
+    return bound
+
+
+def compile_rule(rule: Rule) -> CompiledRule:
+    m = rule.match
+    patterns = [c for c in (_compile(p) for p in (m.patterns or [])) if c is not None]
+    return CompiledRule(
+        rule=rule,
+        keywords=[(kw, kw.lower()) for kw in (m.any_keywords or [])],
+        patterns=patterns,
+        regex=_compile(m.regex, re.IGNORECASE) if m.regex else None,
+    )
+
+
+class RuleEngine:
+    """
+    Rule set compiled once per load_options(): regexes precompiled and all
+    any_keywords of all rules merged into one KeywordMatcher. classify() scans
+    a document once and then scores every rule from that scan.
+
+    Rules are also bucketed by filetype (keeping rule order) and carry their
+    max_score, so classify() can skip rules that cannot change the outcome.
+    """
+
+    def __init__(self, rules: list[Rule], fuzzy_mode: str = "full", fuzzy_budget: int = 4000):
+        if fuzzy_mode not in FUZZY_MODES:
+            raise ValueError(f'fuzzy mode must be one of {", ".join(FUZZY_MODES)}, not "{fuzzy_mode}".')
+        self.rules = rules  # same list object as Options.rules (identity is checked by classify)
+        self.fuzzy_mode = fuzzy_mode
+        self.fuzzy_budget = fuzzy_budget
+        self.compiled = [compile_rule(r) for r in rules]
+        self.matcher = KeywordMatcher([kw for c in self.compiled for _, kw in c.keywords])
+        self.max_scores = [max_score(c) for c in self.compiled]
+
+        # rules without filetypes apply to every extension
+        self._any_ext = [i for i, r in enumerate(rules) if not r.match.filetypes]
+        by_ext: dict[str, set[int]] = {}
+        for i, r in enumerate(rules):
+            for ft in r.match.filetypes or ():
+                by_ext.setdefault(ft, set()).add(i)
+        self._by_ext = {ft: sorted(idxs.union(self._any_ext)) for ft, idxs in by_ext.items()}
+
+    def candidates(self, ext: str) -> list[int]:
+        """Indices of the rules that apply to extension `ext` (no dot, lowercase), in rule order."""
+        return self._by_ext.get(ext, self._any_ext)
+
+    def scan(self, text: str, title_n: int) -> TextScan:
+        lines = text.splitlines()
+        title = "\n".join(lines[:title_n]).lower()
+        body = "\n".join(lines[title_n:]).lower()
+        return TextScan(text=text, title=title, body=body,
+                        title_hits=self.matcher.find(title), body_hits=self.matcher.find(body))
+
+    def _fuzzy_windowed(self, scan: TextScan, keywords: list[tuple[str, str]], cutoff: int) -> bool:
+        """
+        Bounded fuzzy match: compare each keyword against the title lines and
+        against body token runs of similar length (same word count, +-25%
+        characters), drawn from at most fuzzy_budget characters of body text.
+        Not equivalent to "full": typos past the budget or in spans outside the
+        length tolerance are missed, which is why "full" stays the default.
+        """
+        for _, kw_l in keywords:
+            if not kw_l:
+                continue
+            if scan.title and fuzz.partial_ratio(kw_l, scan.title, score_cutoff=cutoff):
+                return True
+            n, tol = len(kw_l), max(1, len(kw_l) // 4)
+            cands = [w for w in scan.windows(len(kw_l.split()) or 1, self.fuzzy_budget)
+                     if abs(len(w) - n) <= tol]
+            if cands and process.extractOne(kw_l, cands, scorer=fuzz.partial_ratio, score_cutoff=cutoff):
+                return True
+        return False
+
+    def score(self, scan: TextScan, idx: int) -> Tuple[float, Optional[str]]:
+        """Return (score, first_keyword_hit) for rule idx; same arithmetic as the per-rule scorer."""
+        c = self.compiled[idx]
+        m = c.rule.match
+        score = 0.0
+        first_kw: Optional[str] = None
+
+        # exact keyword hits
+        if c.keywords:
+            for kw, kw_l in c.keywords:
+                if not kw_l or kw_l in scan.title_hits:
+                    score += m.title_weight
+                    if not first_kw: first_kw = kw
+                elif kw_l in scan.body_hits:
+                    score += m.body_weight
+                    if not first_kw: first_kw = kw
+
+            # fuzzy hit to catch minor typos; only counts when nothing matched exactly
+            if m.fuzzy_min and not first_kw:
+                if self.fuzzy_mode == "windowed":
+                    hit = self._fuzzy_windowed(scan, c.keywords, m.fuzzy_min)
+                else:
+                    best = max((fuzz.partial_ratio(kw_l, scan.lower) for _, kw_l in c.keywords), default=0)
+                    hit = best >= m.fuzzy_min
+                if hit:
+                    first_kw = c.keywords[0][0]
+                    score += m.body_weight
+
+        # regex patterns (structural cues), count as double body weight
+        for rx in c.patterns:
+            if scan.search(rx):
+                score += 2.0
+
+        # simple regex presence (legacy field)
+        if c.regex is not None and scan.search(c.regex):
+            score += m.body_weight
+
+        return score, first_kw
+
+    def score_text(self, text: str, title_n: int) -> list[Tuple[float, Optional[str]]]:
+        scan = self.scan(text, title_n)
+        return [self.score(scan, i) for i in range(len(self.compiled))]
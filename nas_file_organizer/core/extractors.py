@@ -0,0 +1,140 @@
+from __future__ import annotations
+import io
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+# Text extractors keyed by file extension. Each backend (PyMuPDF, Pillow,
+# pytesseract, python-docx, openpyxl, chardet) is imported inside its
+# extractor, so it is only loaded the first time a file of that type shows up.
+
+ENTRY_POINT_GROUP = "nas_file_organizer.extractors"
+
+
+@dataclass(frozen=True)
+class ExtractConfig:
+    ocr_lang: str = "eng"
+    page_window_first: int = 2
+    page_window_last: int = 1
+    ocr_on_empty_text: bool = True
+
+
+Extractor = Callable[[Path, ExtractConfig], str]
+
+_REGISTRY: Dict[str, Extractor] = {}
+_plugins_loaded = False
+
+
+def register_extractor(*exts: str) -> Callable[[Extractor], Extractor]:
+    """Decorator: use fn(path, cfg) -> str for the given extensions (".pdf" or "pdf")."""
+    def deco(fn: Extractor) -> Extractor:
+        for ext in exts:
+            ext = ext.lower()
+            _REGISTRY[ext if ext.startswith(".") else "." + ext] = fn
+        return fn
+    return deco
+
+
+def _load_plugins() -> None:
+    # third-party extractors: entry points in ENTRY_POINT_GROUP named after the extension
+    global _plugins_loaded
+    _plugins_loaded = True
+    try:
+        from importlib.metadata import entry_points
+        eps = entry_points(group=ENTRY_POINT_GROUP)
+    except Exception:
+        return
+    for ep in eps:
+        try:
+            register_extractor(ep.name)(ep.load())
+        except Exception as e:
+            logging.getLogger("nas_organizer").warning("extractor plugin %s failed to load: %s", ep.name, e)
+
+
+def extractor_for(ext: str) -> Optional[Extractor]:
+    ext = ext.lower()
+    fn = _REGISTRY.get(ext)
+    if fn is None and not _plugins_loaded:
+        _load_plugins()
+        fn = _REGISTRY.get(ext)
+    return fn
+
+
+def supported_extensions() -> Iterable[str]:
+    return sorted(_REGISTRY)
+
+
+@register_extractor(".pdf")
+def _pdf_text(path: Path, cfg: ExtractConfig) -> str:
+    try:
+        import fitz                         # PyMuPDF
+        doc = fitz.open(path)
+        n = len(doc)
+        idxs: list[int] = list(range(min(cfg.page_window_first, n)))
+        # add last pages if requested and not overlapping
+        for i in range(max(0, n - cfg.page_window_last), n):
+            if i not in idxs:
+                idxs.append(i)
+
+        parts: list[str] = []
+        for i in idxs:
+            page = doc[i]
+            t = page.get_text("text") or ""
+            if (not t.strip()) and cfg.ocr_on_empty_text:
+                from PIL import Image
+                import pytesseract
+                # low-DPI probe OCR (fast). If you want, bump to 300 later on poor results.
+                pix = page.get_pixmap(dpi=200)
+                img = Image.open(io.BytesIO(pix.tobytes("png")))
+                t = pytesseract.image_to_string(img, lang=cfg.ocr_lang)
+            parts.append(t)
+        return "\n".join(parts)
+    except Exception:
+        return ""
+
+
+@register_extractor(".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".webp")
+def _image_ocr(path: Path, cfg: ExtractConfig) -> str:
+    try:
+        from PIL import Image
+        import pytesseract
+        img = Image.open(path)
+        return pytesseract.image_to_string(img, lang=cfg.ocr_lang)
+    except Exception:
+        return ""
+
+
+@register_extractor(".txt", ".log", ".md")
+def _txt_text(path: Path, cfg: ExtractConfig) -> str:
+    import chardet
+    raw = path.read_bytes()
+    enc = chardet.detect(raw).get("encoding") or "utf-8"
+    try:
+        return raw.decode(enc, errors="ignore")
+    except Exception:
+        return ""
+
+
+@register_extractor(".docx")
+def _docx_text(path: Path, cfg: ExtractConfig) -> str:
+    try:
+        from docx import Document
+        doc = Document(path)
+        return "\n".join(p.text for p in doc.paragraphs)
+    except Exception:
+        return ""
+
+
+@register_extractor(".xlsx")
+def _xlsx_text(path: Path, cfg: ExtractConfig) -> str:
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(path, data_only=True)
+        out = []
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                out.append(" ".join("" if v is None else str(v) for v in row))
+        return "\n".join(out)
+    except Exception:
+        return ""
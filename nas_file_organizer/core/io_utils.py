@@ -1,21 +1,25 @@
 from __future__ import annotations
-import io
+import os
 from pathlib import Path
 from datetime import datetime
 from typing import Iterable, Sequence
-import chardet
-import fitz                         # PyMuPDF
-from PIL import Image
-import pytesseract
-from docx import Document
-from openpyxl import load_workbook
 from .cache import get_text as cache_get, set_text as cache_set
+from .extractors import ExtractConfig, extractor_for
 
 
 def list_files(folder: Path) -> Iterable[Path]:
-    for p in folder.rglob("*"):
-        if p.is_file():
-            yield p
+    # scandir hands back the entry type, so only real files cost a stat
+    stack = [str(folder)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file():
+                        yield Path(e.path)
+        except OSError:
+            continue
 
 def read_text_any(
     path: Path,
@@ -24,105 +28,35 @@ def read_text_any(
     page_window_first: int = 2,
     page_window_last: int = 1,
     ocr_on_empty_text: bool = True,
+    cache_key: str = "path",
+    lookup: bool = True,
+    st: os.stat_result | None = None,
 ) -> str:
-    cached = cache_get(path)
-    if cached is not None:
-        return cached
-    try:
-        if path.stat().st_size > skip_large_mb * 1024 * 1024:
-            return ""
-    except Exception:
-        pass
-    ext = path.suffix.lower()
-
-    if ext == ".pdf":
-        text = _pdf_text(path, ocr_lang, page_window_first, page_window_last, ocr_on_empty_text)
-        if text.strip():
-            cache_set(path, text)
-        return text
-
-    if ext in {".txt", ".log", ".md"}:
-        text = _txt_text(path)
-        if text.strip():
-            cache_set(path, text)
-        return text
-
-    if ext == ".docx":
-        text = _docx_text(path)
-        if text.strip():
-            cache_set(path, text)
-        return text
-
-    if ext == ".xlsx":
-        text = _xlsx_text(path)
-        if text.strip():
-            cache_set(path, text)
-        return text
-
-    if ext in {".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".webp"}:
-        text = _image_ocr(path, ocr_lang)
-        if text.strip():
-            cache_set(path, text)
-        return text
-
-    return ""
-
-def _pdf_text(path: Path, ocr_lang: str, first_n: int, last_n: int, ocr_on_empty: bool) -> str:
-    try:
-        doc = fitz.open(path)
-        n = len(doc)
-        idxs: list[int] = list(range(min(first_n, n)))
-        # add last pages if requested and not overlapping
-        for i in range(max(0, n - last_n), n):
-            if i not in idxs:
-                idxs.append(i)
-
-        parts: list[str] = []
-        for i in idxs:
-            page = doc[i]
-            t = page.get_text("text") or ""
-            if (not t.strip()) and ocr_on_empty:
-                # low-DPI probe OCR (fast). If you want, bump to 300 later on poor results.
-                pix = page.get_pixmap(dpi=200)
-                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                t = pytesseract.image_to_string(img, lang=ocr_lang)
-            parts.append(t)
-        return "\n".join(parts)
-    except Exception:
+    """Extract text (cached). lookup=False skips the cache read when the caller already prefetched a miss."""
+    st = st or path.stat()
+    if lookup:
+        cached = cache_get(path, st, cache_key)
+        if cached is not None:
+            return cached
+    if st.st_size > skip_large_mb * 1024 * 1024:
         return ""
-
-def _image_ocr(path: Path, ocr_lang: str) -> str:
-    try:
-        img = Image.open(path)
-        return pytesseract.image_to_string(img, lang=ocr_lang)
-    except Exception:
+    extract = extractor_for(path.suffix)
+    if extract is None:
         return ""
+    text = extract(path, ExtractConfig(ocr_lang, page_window_first, page_window_last, ocr_on_empty_text))
 
-def _txt_text(path: Path) -> str:
-    raw = path.read_bytes()
-    enc = chardet.detect(raw).get("encoding") or "utf-8"
-    try:
-        return raw.decode(enc, errors="ignore")
-    except Exception:
-        return ""
+    if text.strip():
+        cache_set(path, text, st, cache_key)
+    return text
 
-def _docx_text(path: Path) -> str:
-    try:
-        doc = Document(path)
-        return "\n".join(p.text for p in doc.paragraphs)
-    except Exception:
-        return ""
+def init_extract_worker() -> None:
+    """Pool initializer: keep Tesseract to one OpenMP thread per worker process."""
+    # pytesseract shells out to the tesseract binary, which inherits this env
+    os.environ["OMP_THREAD_LIMIT"] = "1"
 
-def _xlsx_text(path: Path) -> str:
-    try:
-        wb = load_workbook(path, data_only=True)
-        out = []
-        for ws in wb.worksheets:
-            for row in ws.iter_rows(values_only=True):
-                out.append(" ".join("" if v is None else str(v) for v in row))
-        return "\n".join(out)
-    except Exception:
-        return ""
+def extract_one(path: Path, kwargs: dict) -> str:
+    """Picklable wrapper around read_text_any for process pools."""
+    return read_text_any(path, **kwargs)
 
 def next_available(p: Path) -> Path:
     if not p.exists(): return p
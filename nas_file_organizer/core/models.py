@@ -1,7 +1,7 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Any, Optional, Sequence
 
 @dataclass
 class RuleMatch:
@@ -38,6 +38,13 @@ class Options:
     dry_run: bool = True
     skip_large_mb: int = 50
     title_lines: int = 5
+    workers: int = 1                 # extraction processes; <= 1 runs inline
+    fuzzy_mode: str = "full"         # full | windowed (faster, lower recall; see RuleEngine._fuzzy_windowed)
+    fuzzy_budget: int = 4000         # body chars the windowed fuzzy matcher may look at
+    cache_key: str = "path"          # path | content | content_full (text cache + ml_samples key)
+    incremental_scan: bool = False   # reuse the persisted inbox snapshot for unchanged directories
+    ml_batch: int = 32               # files per vectorized ML prediction in plan()
+    engine: Any = field(default=None, repr=False, compare=False)  # core.engine.RuleEngine
 
 @dataclass
 class Result:
@@ -47,3 +54,4 @@ class Result:
     ok: bool
     reason: Optional[str] = None
     text_excerpt: str = ""
+    fingerprint: Optional[str] = None   # src size:mtime_ns when planned (core.planfile)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional
+
+from .models import Result
+
+# Plan files are JSON lines: a header object, then one object per planned file.
+# They carry each source file's fingerprint so a later execute can tell whether
+# the file is still the one that was planned without extracting it again.
+PLAN_FORMAT = 1
+
+
+class PlanFileError(ValueError):
+    pass
+
+
+def fingerprint(st: os.stat_result) -> str:
+    """size:mtime_ns of a source file (works for os.stat_result and scan.FileStat)."""
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def result_to_dict(r: Result) -> dict:
+    return {
+        "src": str(r.src),
+        "dst": (str(r.dst) if r.dst else None),
+        "rule": r.rule,
+        "reason": r.reason,
+        "ok": r.ok,
+        "fingerprint": r.fingerprint,
+        "text_excerpt": r.text_excerpt,
+    }
+
+
+def result_from_dict(d: dict) -> Result:
+    return Result(
+        src=Path(d["src"]),
+        dst=(Path(d["dst"]) if d.get("dst") else None),
+        rule=d.get("rule"),
+        ok=bool(d.get("ok", True)),
+        reason=d.get("reason"),
+        text_excerpt=d.get("text_excerpt") or "",
+        fingerprint=d.get("fingerprint"),
+    )
+
+
+def rules_digest(rules: Path) -> Optional[str]:
+    """sha1 of a rules file's bytes, recorded in plan headers; None if it can't be read."""
+    try:
+        return hashlib.sha1(Path(rules).read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def write_plan(results: Iterable[Result], out: IO[str], inbox: Optional[Path] = None,
+               rules: Optional[Path] = None) -> int:
+    """Write a plan to an open text stream, one line per result as it arrives. Returns the count."""
+    out.write(json.dumps({"plan_format": PLAN_FORMAT, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                          "inbox": (str(Path(inbox).resolve()) if inbox else None),
+                          "rules": (str(rules) if rules else None),
+                          "rules_sha1": (rules_digest(rules) if rules else None)}) + "\n")
+    n = 0
+    for r in results:
+        out.write(json.dumps(result_to_dict(r)) + "\n")
+        n += 1
+    return n
+
+
+def save_plan(results: Iterable[Result], path: Path, inbox: Optional[Path] = None,
+              rules: Optional[Path] = None) -> int:
+    # written next to the target and renamed, so a half-written plan is never picked up
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        n = write_plan(results, f, inbox, rules)
+    os.replace(tmp, path)
+    return n
+
+
+def read_plan_header(path: Path) -> dict:
+    with Path(path).open("r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+    if header.get("plan_format") != PLAN_FORMAT:
+        raise PlanFileError(f"{path}: not a plan file (format {header.get('plan_format')!r})")
+    return header
+
+
+def plan_mismatches(header: dict, inbox: Path, rules: Optional[Path] = None) -> list[str]:
+    """
+    Why a plan doesn't belong to this inbox/rules file (empty if it does).
+    The per-file fingerprints only prove a file is unchanged, not that the
+    plan was made for it with these rules.
+    """
+    problems = []
+    want = str(Path(inbox).resolve())
+    if header.get("inbox") is None:
+        problems.append("plan does not record its inbox")
+    elif str(Path(header["inbox"]).resolve()) != want:
+        problems.append(f"plan is for inbox {header['inbox']}, not {want}")
+    if rules is not None and header.get("rules_sha1") != rules_digest(rules):
+        problems.append(f"plan was made with different rules than {rules}")
+    return problems
+
+
+def read_plan(path: Path) -> Iterator[Result]:
+    """Stream the results of a plan file."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("plan_format") != PLAN_FORMAT:
+            raise PlanFileError(f"{path}: not a plan file (format {header.get('plan_format')!r})")
+        for ln, line in enumerate(f, start=2):
+            if not line.strip():
+                continue
+            try:
+                yield result_from_dict(json.loads(line))
+            except (ValueError, KeyError) as e:
+                raise PlanFileError(f"{path}:{ln}: {e}") from e
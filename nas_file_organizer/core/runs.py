@@ -0,0 +1,313 @@
+from __future__ import annotations
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from .models import Result
+
+CACHE_DB = os.environ.get("CACHE_DB", "/data/cache.db")
+# a lease not renewed for this long belongs to a dead process and may be taken over
+LEASE_SECONDS = float(os.environ.get("RUN_LEASE_SECONDS", "300"))
+# how often a waiting run re-checks the lease (and proves it is still alive)
+POLL_SECONDS = float(os.environ.get("RUN_POLL_SECONDS", "1.0"))
+# how often the holder's background thread renews its lease (and stores its counters)
+HEARTBEAT_SECONDS = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_lease (
+  inbox      TEXT PRIMARY KEY,
+  run_id     TEXT NOT NULL,
+  owner      TEXT NOT NULL,     -- host:pid
+  expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+  id            TEXT PRIMARY KEY,
+  inbox         TEXT NOT NULL,
+  trigger       TEXT NOT NULL,  -- cli | web | watch | ...
+  scope         TEXT NOT NULL,  -- inbox (whole inbox) | paths (given files only)
+  owner         TEXT NOT NULL,
+  status        TEXT NOT NULL,  -- queued | running | succeeded | failed | merged | abandoned
+  merged_into   TEXT,
+  requested_at  REAL NOT NULL,
+  started_at    REAL,
+  finished_at   REAL,
+  heartbeat_at  REAL,
+  files         INTEGER DEFAULT 0,
+  moved         INTEGER DEFAULT 0,
+  errors        INTEGER DEFAULT 0,
+  files_per_sec REAL,
+  error         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_inbox_status ON runs(inbox, status);
+"""
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseLost(RuntimeError):
+    """The run's lease expired and another run took the inbox over; stop moving files."""
+
+
+@dataclass
+class Run:
+    id: str
+    inbox: str
+    trigger: str
+    scope: str
+    status: str = "queued"              # running once it holds the lease; merged | busy if it never will
+    files: int = 0
+    moved: int = 0
+    errors: int = 0
+    started_at: float = 0.0
+    merged_into: Optional[str] = None   # the queued run this request was folded into
+    lease_lost: bool = False            # set by heartbeat() when the lease row is no longer ours
+
+    @property
+    def active(self) -> bool:
+        return self.status == "running"
+
+    @property
+    def files_per_sec(self) -> float:
+        return round(self.files / max(time.time() - self.started_at, 1e-6), 2) if self.started_at else 0.0
+
+
+class RunCoordinator:
+    """
+    One organize execution per inbox at a time, across processes (web, CLI,
+    watcher), via a lease row in SQLite.
+
+    start() takes the lease or queues behind the active run. Waiting runs are
+    served in request order. A whole-inbox run that finds another whole-inbox
+    run already queued merges into it instead of queueing a duplicate: the
+    queued run scans the inbox after the active one finishes, so it covers the
+    newcomer's files too. Leases expire LEASE_SECONDS after their last renewal,
+    so a crashed process blocks the inbox only until then. Every run is
+    recorded in the runs table with its trigger, outcome and throughput.
+    """
+
+    def __init__(self, inbox: Path | str, db_path: Optional[str] = None, lease_seconds: Optional[float] = None):
+        self.inbox = str(Path(inbox).resolve())
+        self.db_path = db_path or CACHE_DB
+        self.lease_seconds = LEASE_SECONDS if lease_seconds is None else lease_seconds
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode so BEGIN IMMEDIATE below controls the write lock explicitly
+        con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        con.executescript(SCHEMA)
+        return con
+
+    def start(self, trigger: str, scope: str = "inbox", wait: bool = True,
+              on_wait: Optional[Callable[[str], None]] = None) -> Run:
+        """
+        Returns the Run: status "running" once it holds the lease, "merged" if it
+        was folded into a queued run (merged_into), or "busy" if wait=False and
+        the inbox is taken. on_wait(active_run_id) is called once when queueing.
+        """
+        run = Run(id=uuid.uuid4().hex[:12], inbox=self.inbox, trigger=trigger, scope=scope)
+        con = self._connect()
+        try:
+            now = time.time()
+            con.execute("BEGIN IMMEDIATE")
+            if scope == "inbox":
+                row = con.execute("""
+                    SELECT id FROM runs WHERE inbox=? AND status='queued' AND scope='inbox' AND heartbeat_at > ?
+                    ORDER BY requested_at LIMIT 1
+                """, (self.inbox, now - self.lease_seconds)).fetchone()
+                if row:
+                    self._insert(con, run, "merged", now, merged_into=row[0])
+                    con.execute("COMMIT")
+                    return run
+            self._insert(con, run, "queued", now)
+            got = self._try_acquire(con, run, now)
+            con.execute("COMMIT")
+            if got:
+                return run
+            if not wait:
+                con.execute("UPDATE runs SET status='abandoned', finished_at=? WHERE id=?", (now, run.id))
+                run.status = "busy"
+                return run
+
+            if on_wait is not None:
+                lease = con.execute("SELECT run_id FROM run_lease WHERE inbox=?", (self.inbox,)).fetchone()
+                on_wait(lease[0] if lease else "")
+            while True:
+                time.sleep(POLL_SECONDS)
+                now = time.time()
+                con.execute("BEGIN IMMEDIATE")
+                con.execute("UPDATE runs SET heartbeat_at=? WHERE id=?", (now, run.id))
+                got = self._try_acquire(con, run, now)
+                con.execute("COMMIT")
+                if got:
+                    return run
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            # don't leave a queued row that others would wait behind until it goes stale
+            con.execute("UPDATE runs SET status='abandoned', finished_at=? WHERE id=? AND status='queued'",
+                        (time.time(), run.id))
+            raise
+        finally:
+            con.close()
+
+    def _insert(self, con: sqlite3.Connection, run: Run, status: str, now: float,
+                merged_into: Optional[str] = None) -> None:
+        run.status, run.merged_into = status, merged_into
+        con.execute("""
+            INSERT INTO runs(id, inbox, trigger, scope, owner, status, merged_into, requested_at, heartbeat_at)
+            VALUES(?,?,?,?,?,?,?,?,?)
+        """, (run.id, run.inbox, run.trigger, run.scope, _owner(), status, merged_into, now, now))
+
+    def _try_acquire(self, con: sqlite3.Connection, run: Run, now: float) -> bool:
+        # caller holds BEGIN IMMEDIATE
+        lease = con.execute("SELECT run_id, expires_at FROM run_lease WHERE inbox=?", (self.inbox,)).fetchone()
+        if lease and lease[1] > now:
+            return False
+        ahead = con.execute("""
+            SELECT 1 FROM runs WHERE inbox=? AND status='queued' AND id<>?
+              AND requested_at < (SELECT requested_at FROM runs WHERE id=?) AND heartbeat_at > ?
+            LIMIT 1
+        """, (self.inbox, run.id, run.id, now - self.lease_seconds)).fetchone()
+        if ahead:
+            return False
+        if lease:
+            # expired: its holder died without releasing
+            con.execute("UPDATE runs SET status='abandoned', finished_at=? WHERE id=? AND status='running'",
+                        (now, lease[0]))
+        con.execute("""
+            INSERT INTO run_lease(inbox, run_id, owner, expires_at) VALUES(?,?,?,?)
+            ON CONFLICT(inbox) DO UPDATE SET run_id=excluded.run_id, owner=excluded.owner,
+              expires_at=excluded.expires_at
+        """, (self.inbox, run.id, _owner(), now + self.lease_seconds))
+        con.execute("UPDATE runs SET status='running', started_at=?, heartbeat_at=? WHERE id=?",
+                    (now, now, run.id))
+        run.status, run.started_at = "running", now
+        return True
+
+    def heartbeat(self, run: Run) -> bool:
+        """
+        Renew the lease and store the run's counters so far. Returns False (and
+        sets run.lease_lost) if the lease now belongs to another run or process.
+        """
+        now = time.time()
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            renewed = con.execute("UPDATE run_lease SET expires_at=? WHERE inbox=? AND run_id=? AND owner=?",
+                                  (now + self.lease_seconds, self.inbox, run.id, _owner())).rowcount
+            con.execute("UPDATE runs SET heartbeat_at=?, files=?, moved=?, errors=?, files_per_sec=? WHERE id=?",
+                        (now, run.files, run.moved, run.errors, run.files_per_sec, run.id))
+            con.execute("COMMIT")
+        finally:
+            con.close()
+        if not renewed:
+            run.lease_lost = True
+        return bool(renewed)
+
+    def keep_alive(self, run: Run) -> Callable[[], None]:
+        """
+        Renew run's lease from a daemon thread every HEARTBEAT_SECONDS (or a third
+        of the lease, if shorter) until the returned stop function is called, so
+        long stretches without results (OCR, planning) don't let it expire.
+        """
+        stop = threading.Event()
+        interval = min(HEARTBEAT_SECONDS, self.lease_seconds / 3)
+
+        def renew() -> None:
+            while not stop.wait(interval):
+                try:
+                    if not self.heartbeat(run):
+                        return
+                except sqlite3.Error:
+                    continue   # busy/locked DB: try again next interval, the lease has slack
+
+        t = threading.Thread(target=renew, name=f"run-lease-{run.id}", daemon=True)
+        t.start()
+
+        def stop_fn() -> None:
+            stop.set()
+            t.join()
+        return stop_fn
+
+    def track(self, run: Run, results: Iterable[Result]) -> Iterator[Result]:
+        """
+        Pass results through, counting them. The lease is checked before each
+        result is pulled (i.e. before the next move); LeaseLost is raised once
+        another run has taken the inbox over.
+        """
+        it = iter(results)
+        while True:
+            if run.lease_lost:
+                raise LeaseLost(f"run {run.id} lost its lease on {self.inbox}")
+            try:
+                r = next(it)
+            except StopIteration:
+                return
+            run.files += 1
+            if not r.ok:
+                run.errors += 1
+            elif r.dst and r.reason != "no_match":
+                run.moved += 1
+            yield r
+
+    def finish(self, run: Run, error: Optional[str] = None) -> None:
+        now = time.time()
+        run.status = "failed" if error else "succeeded"
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("""
+                UPDATE runs SET status=?, finished_at=?, heartbeat_at=?, files=?, moved=?, errors=?,
+                  files_per_sec=?, error=? WHERE id=?
+            """, (run.status, now, now, run.files, run.moved, run.errors,
+                  run.files_per_sec, error, run.id))
+            con.execute("DELETE FROM run_lease WHERE inbox=? AND run_id=?", (self.inbox, run.id))
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    def history(self, limit: int = 50) -> list[dict]:
+        con = self._connect()
+        con.row_factory = sqlite3.Row
+        try:
+            rows = con.execute("SELECT * FROM runs WHERE inbox=? ORDER BY requested_at DESC LIMIT ?",
+                               (self.inbox, limit)).fetchall()
+            return [dict(r) for r in rows]
+        finally:
+            con.close()
+
+
+@contextmanager
+def exclusive_run(inbox: Path | str, trigger: str, scope: str = "inbox", wait: bool = True,
+                  on_wait: Optional[Callable[[str], None]] = None) -> Iterator[tuple[RunCoordinator, Run]]:
+    """
+    with exclusive_run(opts.inbox, "cli") as (coord, run):
+        if run.active:
+            for r in coord.track(run, svc.execute(opts)): ...
+
+    The lease is renewed in the background for the whole block and released
+    (and the run recorded) when the block exits.
+    """
+    coord = RunCoordinator(inbox)
+    run = coord.start(trigger, scope=scope, wait=wait, on_wait=on_wait)
+    if not run.active:
+        yield coord, run
+        return
+    stop = coord.keep_alive(run)
+    try:
+        yield coord, run
+    except BaseException as e:
+        stop()
+        coord.finish(run, error=f"{type(e).__name__}: {e}")
+        raise
+    else:
+        stop()
+        coord.finish(run)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CACHE_DB = os.environ.get("CACHE_DB", "/data/cache.db")
+# rows per transaction, and how long a partial batch may wait before it is written anyway
+BATCH_ROWS = int(os.getenv("ML_SAMPLE_BATCH", "256"))
+FLUSH_MS = int(os.getenv("ML_SAMPLE_FLUSH_MS", "500"))
+# pending rows beyond this are dropped (and counted) rather than stalling classification
+QUEUE_MAX = int(os.getenv("ML_SAMPLE_QUEUE", "10000"))
+# ml_samples.text is capped; the review UI and training only need the start of a document
+TEXT_MAX = 20000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ml_samples (
+  file_hash       TEXT PRIMARY KEY,
+  path            TEXT,
+  text            TEXT,
+  predicted_label TEXT,
+  confidence      REAL,
+  created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_INSERT = """
+INSERT OR REPLACE INTO ml_samples
+(file_hash, path, text, predicted_label, confidence, created_at, updated_at)
+VALUES(?,?,?,?,?,CURRENT_TIMESTAMP,CURRENT_TIMESTAMP)
+"""
+
+_STOP = object()
+
+
+class SampleWriter:
+    """
+    Prediction log for the Review UI, written off the planning thread.
+
+    add() only enqueues; a background thread drains the queue into ml_samples
+    with one executemany per transaction, committing every BATCH_ROWS rows or
+    FLUSH_MS milliseconds, whichever comes first, on a single long-lived
+    connection. A full queue drops the row and a failed transaction drops its
+    batch; both are counted (see snapshot_stats) and never raised to the
+    caller. Pending rows are flushed at interpreter exit.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB, batch_rows: int = BATCH_ROWS,
+                 flush_ms: int = FLUSH_MS, queue_max: int = QUEUE_MAX):
+        self.db_path = db_path
+        self.batch_rows = max(1, batch_rows)
+        self.flush_s = max(0, flush_ms) / 1000.0
+        self._q: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0}
+        self.last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def add(self, file_hash: str, path, text: Optional[str],
+            predicted_label: Optional[str], confidence: Optional[float]) -> bool:
+        """Enqueue one sample row. Returns False if it was dropped."""
+        if self._closed:
+            self._bump("dropped")
+            return False
+        self._ensure_thread()
+        row = (file_hash, str(path), (text or "")[:TEXT_MAX], predicted_label or "", float(confidence or 0.0))
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("queued")
+        return True
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ml-sample-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        con: Optional[sqlite3.Connection] = None
+        stop = False
+        while not stop:
+            item = self._q.get()
+            batch, done = [], 1
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+            deadline = time.monotonic() + self.flush_s
+            while not stop and len(batch) < self.batch_rows:
+                left = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                done += 1
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                con = self._write(con, batch)
+            for _ in range(done):
+                self._q.task_done()
+        if con is not None:
+            con.close()
+
+    def _write(self, con: Optional[sqlite3.Connection], batch: list) -> Optional[sqlite3.Connection]:
+        try:
+            if con is None:
+                con = sqlite3.connect(self.db_path, timeout=30)
+                con.executescript(SCHEMA)
+            with con:   # one transaction per batch
+                con.executemany(_INSERT, batch)
+            self._bump("written", len(batch))
+            self._bump("batches")
+        except Exception as e:
+            self._bump("failed", len(batch))
+            self.last_error = f"{type(e).__name__}: {e}"
+            logging.getLogger("nas_organizer").warning("ml_samples: dropped batch of %d rows (%s)",
+                                                       len(batch), self.last_error)
+            if con is not None:
+                con.close()
+            con = None   # reconnect on the next batch
+        return con
+
+    def flush(self) -> None:
+        """Block until every row enqueued so far has been written (or counted as failed)."""
+        if self._thread is not None:
+            self._q.join()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write what is pending and stop the thread (registered with atexit)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "pending": self._q.qsize(), "last_error": self.last_error}
+
+
+_default: SampleWriter | None = None
+_default_lock = threading.Lock()
+
+
+def default_sample_writer() -> SampleWriter:
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = SampleWriter()
+                atexit.register(_default.close)
+    return _default
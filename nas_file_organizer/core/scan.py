@@ -0,0 +1,165 @@
+from __future__ import annotations
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple
+
+CACHE_DB = os.environ.get("CACHE_DB", "/data/cache.db")
+# a directory modified this recently may still gain entries within the same
+# mtime tick (SMB/NFS round to seconds), so it is re-listed on the next scan
+RACY_SECONDS = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inbox_snapshot (
+  path     TEXT PRIMARY KEY,
+  root     TEXT NOT NULL,
+  parent   TEXT NOT NULL,
+  inode    INTEGER,
+  size     INTEGER,
+  mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_inbox_snapshot_root ON inbox_snapshot(root);
+CREATE TABLE IF NOT EXISTS inbox_dirs (
+  path     TEXT PRIMARY KEY,
+  root     TEXT NOT NULL,
+  parent   TEXT,
+  mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_inbox_dirs_root ON inbox_dirs(root);
+"""
+
+
+class FileStat(NamedTuple):
+    """The stat fields the organizer uses; duck-types os.stat_result for the cache/planner."""
+    st_ino: int
+    st_size: int
+    st_mtime_ns: int
+
+    @property
+    def st_mtime(self) -> float:
+        return self.st_mtime_ns / 1e9
+
+
+@dataclass
+class ScanResult:
+    files: dict[Path, FileStat]
+    added: list[Path] = field(default_factory=list)
+    changed: list[Path] = field(default_factory=list)
+    removed: list[Path] = field(default_factory=list)
+    dirs_listed: int = 0
+    dirs_skipped: int = 0
+
+
+class InboxScanner:
+    """
+    Inbox walker backed by a persisted snapshot (path, inode, size, mtime_ns per
+    file plus the mtime of every directory).
+
+    A directory whose mtime hasn't moved since the last scan cannot have gained,
+    lost or renamed entries, so its file list is taken from the snapshot instead
+    of listing it. The files themselves are still stat'ed every scan, because a
+    file rewritten in place (same name) doesn't touch the directory mtime; what
+    is saved is the directory listing. Pass full=True to re-list everything.
+    """
+
+    def __init__(self, root: Path, db_path: str = CACHE_DB):
+        self.root = Path(root)
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path)
+        con.executescript(SCHEMA)
+        return con
+
+    def scan(self, full: bool = False) -> ScanResult:
+        root = str(self.root)
+        con = self._connect()
+        try:
+            old_files: dict[str, dict[str, FileStat]] = {}
+            for path, parent, ino, size, mtime_ns in con.execute(
+                    "SELECT path, parent, inode, size, mtime_ns FROM inbox_snapshot WHERE root=?", (root,)):
+                old_files.setdefault(parent, {})[path] = FileStat(ino, size, mtime_ns)
+            old_dirs: dict[str, int] = {}
+            old_children: dict[str, list[str]] = {}
+            for path, parent, mtime_ns in con.execute(
+                    "SELECT path, parent, mtime_ns FROM inbox_dirs WHERE root=?", (root,)):
+                old_dirs[path] = mtime_ns
+                if parent is not None:
+                    old_children.setdefault(parent, []).append(path)
+
+            res = ScanResult(files={})
+            seen_dirs: dict[str, tuple[str | None, int]] = {}
+            upserts: list[tuple] = []
+            now_ns = time.time_ns()
+            stack: list[tuple[str, str | None]] = [(root, None)]
+            while stack:
+                d, parent = stack.pop()
+                try:
+                    dmtime = os.stat(d).st_mtime_ns
+                except OSError:
+                    continue
+                racy = (now_ns - dmtime) < RACY_SECONDS * 1e9
+                seen_dirs[d] = (parent, -1 if racy else dmtime)
+
+                if not full and old_dirs.get(d) == dmtime:
+                    # the listing is unchanged, but a file rewritten in place keeps its name
+                    # (and the directory mtime), so every file is still stat'ed
+                    res.dirs_skipped += 1
+                    for path, last in old_files.get(d, {}).items():
+                        try:
+                            s = os.stat(path)
+                        except OSError:
+                            continue   # vanished since the listing; reported as removed below
+                        st = FileStat(s.st_ino, s.st_size, s.st_mtime_ns)
+                        res.files[Path(path)] = st
+                        if last != st:
+                            res.changed.append(Path(path))
+                            upserts.append((path, root, d, st.st_ino, st.st_size, st.st_mtime_ns))
+                    stack.extend((c, d) for c in old_children.get(d, ()))
+                    continue
+
+                res.dirs_listed += 1
+                known = old_files.get(d, {})
+                try:
+                    with os.scandir(d) as it:
+                        for e in it:
+                            if e.is_dir(follow_symlinks=False):
+                                stack.append((e.path, d))
+                            elif e.is_file():
+                                try:
+                                    s = e.stat()
+                                except OSError:
+                                    continue
+                                st = FileStat(s.st_ino, s.st_size, s.st_mtime_ns)
+                                res.files[Path(e.path)] = st
+                                prev = known.get(e.path)
+                                if prev is None:
+                                    res.added.append(Path(e.path))
+                                elif prev != st:
+                                    res.changed.append(Path(e.path))
+                                if prev != st:
+                                    upserts.append((e.path, root, d, st.st_ino, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+
+            # anything in the old snapshot that we neither reused nor re-listed is gone
+            removed = [p for files in old_files.values() for p in files if Path(p) not in res.files]
+            res.removed = [Path(p) for p in removed]
+
+            con.executemany("DELETE FROM inbox_snapshot WHERE path=?", [(p,) for p in removed])
+            con.executemany("""
+                INSERT INTO inbox_snapshot(path, root, parent, inode, size, mtime_ns) VALUES(?,?,?,?,?,?)
+                ON CONFLICT(path) DO UPDATE SET parent=excluded.parent, inode=excluded.inode,
+                  size=excluded.size, mtime_ns=excluded.mtime_ns
+            """, upserts)
+            con.executemany("DELETE FROM inbox_dirs WHERE path=?", [(d,) for d in old_dirs if d not in seen_dirs])
+            con.executemany("""
+                INSERT INTO inbox_dirs(path, root, parent, mtime_ns) VALUES(?,?,?,?)
+                ON CONFLICT(path) DO UPDATE SET parent=excluded.parent, mtime_ns=excluded.mtime_ns
+            """, [(d, root, parent, m) for d, (parent, m) in seen_dirs.items() if old_dirs.get(d) != m])
+            con.commit()
+            return res
+        finally:
+            con.close()
@@ -1,36 +1,75 @@
 from __future__ import annotations
-import re
 import logging
 from pathlib import Path
 from datetime import datetime
-from typing import Iterable, Optional, Tuple
-from rapidfuzz import fuzz
+from collections import Counter, OrderedDict
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, cast
 from ruyaml import YAML
 from .models import Options, Rule, RuleMatch, RuleAction, Result
-from .io_utils import list_files, read_text_any, next_available, render_template
+from .engine import RuleEngine
+from .cache import KEY_MODES, default_cache
+from .scan import InboxScanner
+from .planfile import fingerprint
+from .samples import default_sample_writer
+from .io_utils import (list_files, read_text_any, next_available, render_template,
+                       extract_one, init_extract_worker)
+# the ML model is loaded lazily and hot-swapped when the file on disk changes (retrain)
+from nas_file_organizer.ml.holder import default_holder
 import errno, shutil
-import os, joblib
-import sqlite3, hashlib  # for logging predictions to DB
+import multiprocessing
+import os
+import hashlib
+import threading
 
 yaml = YAML(typ="safe")
 _log = None
 
-# load the ML model once (reuse across requests)
-MODEL_PATH = os.environ.get("MODEL_PATH", "/data/model.pkl")
-if os.path.exists(MODEL_PATH):
-    _ml_pipe = joblib.load(MODEL_PATH)["pipeline"]
-else:
-    _ml_pipe = None
+# (model version, text hash) -> (label, confidence); a text is never scored twice per model
+PRED_CACHE_SIZE = int(os.getenv("ML_PRED_CACHE", "4096"))
+_pred_cache: OrderedDict[tuple[str, str], tuple[Optional[str], float]] = OrderedDict()
+_pred_lock = threading.Lock()
+
+def _text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+def ml_predict_many(texts: Sequence[str]) -> list[tuple[Optional[str], float]]:
+    """Return (label, confidence) per text; cache misses are scored in one predict_proba call."""
+    model = default_holder().current()  # one generation for the whole batch
+    if model is None:
+        return [(None, 0.0)] * len(texts)
+    pipe = model.pipeline
+    keys = [(model.version, _text_hash(t)) for t in texts]
+    out: list[Optional[tuple[Optional[str], float]]] = [None] * len(texts)
+    todo: dict[tuple[str, str], str] = {}
+    with _pred_lock:
+        for i, k in enumerate(keys):
+            hit = _pred_cache.get(k)
+            if hit is not None:
+                _pred_cache.move_to_end(k)
+                out[i] = hit
+            else:
+                todo.setdefault(k, texts[i])
+    if todo:
+        proba = pipe.predict_proba(list(todo.values()))
+        idx = proba.argmax(axis=1)
+        fresh = {k: (pipe.classes_[j], float(row[j]))
+                 for k, row, j in zip(todo, proba, (int(x) for x in idx))}
+        with _pred_lock:
+            for k, v in fresh.items():
+                _pred_cache[k] = v
+            while len(_pred_cache) > PRED_CACHE_SIZE:
+                _pred_cache.popitem(last=False)
+        for i, k in enumerate(keys):
+            if out[i] is None:
+                out[i] = fresh[k]
+    return out  # type: ignore[return-value]
 
 def ml_predict(text: str):
     """Return (label, confidence) from ML model."""
-    if not _ml_pipe:
-        return None, 0.0
-    proba = _ml_pipe.predict_proba([text])[0]
-    idx = int(proba.argmax())
-    label = _ml_pipe.classes_[idx]
-    conf = float(proba[idx])
-    return label, conf
+    return ml_predict_many([text])[0]
 
 ML_MODE = os.getenv("ML_MODE", "HYBRID").upper()
 THRESH = float(os.getenv("ML_THRESHOLD", "0.75"))
@@ -45,38 +84,17 @@ def decide(rules_label, ml_label, ml_conf):
         return ml_label, "ml"
     return (rules_label or ml_label or "Unknown"), "rules"
 
-def _file_hash_for(p: Path) -> str:
-    # path-based hash so each file is unique in DB even if content matches
-    return hashlib.sha256(str(p).encode("utf-8")).hexdigest()
+def _file_hash_for(p: Path, key_mode: str = "path") -> str:
+    if key_mode == "path":
+        # path-based hash so each file is unique in DB even if content matches
+        return hashlib.sha256(str(p).encode("utf-8")).hexdigest()
+    # content key: samples (and their labels) follow the file through moves and renames
+    return default_cache().content_key(p, full=(key_mode == "content_full"))
 
 def _log_ml_sample(file_hash: str, path: Path, text: str | None,
                    predicted_label: str | None, confidence: float | None) -> None:
-    try:
-        with sqlite3.connect(os.environ.get("CACHE_DB", "/data/cache.db")) as c:
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS ml_samples (
-                  file_hash       TEXT PRIMARY KEY,
-                  path            TEXT,
-                  text            TEXT,
-                  predicted_label TEXT,
-                  confidence      REAL,
-                  created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );""")
-            c.execute("""
-                INSERT OR REPLACE INTO ml_samples
-                (file_hash, path, text, predicted_label, confidence, created_at, updated_at)
-                VALUES(?,?,?,?,?,CURRENT_TIMESTAMP,CURRENT_TIMESTAMP)
-            """, (
-                file_hash,
-                str(path),
-                (text or "")[:20000],  # keep it reasonable
-                predicted_label or "",
-                float(confidence or 0.0),
-            ))
-    except Exception:
-        # never break classification on logging errors
-        pass
+    # queued for the batched writer; drops/failures are counted there, never raised into classification
+    default_sample_writer().add(file_hash, path, text, predicted_label, confidence)
 
 def _label_of_rule(rule: Rule, archive_root: Path | None = None) -> str | None:
     """
@@ -139,6 +157,16 @@ def get_log() -> logging.Logger:
         _log = logging.getLogger("nas_organizer")
     return _log
 
+def _read_kwargs(opts: Options) -> dict:
+    return dict(
+        ocr_lang=opts.ocr_languages,
+        skip_large_mb=opts.skip_large_mb,
+        page_window_first=opts.page_window_first,
+        page_window_last=opts.page_window_last,
+        ocr_on_empty_text=opts.ocr_on_empty_text,
+        cache_key=opts.cache_key,
+    )
+
 def _as_str(val, field: str, rule_name: str) -> str:
     if isinstance(val, list):
         if len(val) == 1 and isinstance(val[0], str):
@@ -158,6 +186,11 @@ def _as_list_str(val, field: str, rule_name: str) -> list[str] | None:
     raise ValueError(f'Rule "{rule_name}": field "{field}" must be a string or list of strings.')
 
 class OrganizerService:
+    def __init__(self) -> None:
+        self.trace = False
+        # per-run rule evaluation counters (reset by plan())
+        self.rule_stats: Counter[str] = Counter()
+
     def load_options(self, rules_file: Path) -> Options:
         cfg = yaml.load(rules_file.read_text(encoding="utf-8"))
 
@@ -190,6 +223,12 @@ class OrganizerService:
         page_window = defaults.get("page_window", {}) or {}
         first = int(page_window.get("first", 2))
         last  = int(page_window.get("last", 1))
+        fuzzy = defaults.get("fuzzy", {}) or {}
+        fuzzy_mode = str(fuzzy.get("mode", "full"))
+        fuzzy_budget = int(fuzzy.get("budget_chars", 4000))
+        cache_key = str(defaults.get("cache_key", "path"))
+        if cache_key not in KEY_MODES:
+            raise ValueError(f'defaults.cache_key must be one of {", ".join(KEY_MODES)}.')
 
         return Options(
             inbox=Path(cfg["inbox"]),
@@ -202,72 +241,57 @@ class OrganizerService:
             dry_run=bool(defaults.get("dry_run", True)),
             skip_large_mb=int(defaults.get("skip_large_mb", 50)),
             title_lines=int(defaults.get("title_lines", 5)),
+            workers=int(defaults.get("workers", 1)),
+            fuzzy_mode=fuzzy_mode,
+            fuzzy_budget=fuzzy_budget,
+            cache_key=cache_key,
+            incremental_scan=bool(defaults.get("incremental_scan", False)),
+            ml_batch=max(1, int(defaults.get("ml_batch", 32))),
+            engine=RuleEngine(rules, fuzzy_mode=fuzzy_mode, fuzzy_budget=fuzzy_budget),
         )
 
     # --- scoring & classification
 
     def _score_rule(self, text: str, rule: Rule, title_n: int) -> Tuple[float, Optional[str]]:
         """Return (score, first_keyword_hit)."""
-        m = rule.match
-
-        # Split text into title (first 5 lines) and body (rest)
-        lines = text.splitlines()
-        title = "\n".join(lines[:title_n])
-        body = "\n".join(lines[title_n:])
-
-        score = 0.0
-        first_kw: Optional[str] = None
-
-        # exact keyword hits
-        if m.any_keywords:
-            for kw in m.any_keywords:
-                if kw.lower() in title.lower():
-                    score += m.title_weight
-                    if not first_kw: first_kw = kw
-                elif kw.lower() in body.lower():
-                    score += m.body_weight
-                    if not first_kw: first_kw = kw
-
-            # fuzzy hit (anywhere) to catch minor typos
-            if m.fuzzy_min:
-                best = max((fuzz.partial_ratio(kw.lower(), text.lower()) for kw in m.any_keywords), default  = 0)
-                if best >= m.fuzzy_min and not first_kw:
-                    first_kw = m.any_keywords[0]
-                    # give it a lighter boost than exact-title
-                    score += m.body_weight
-
-        # regex patterns (structural cues), count as double body weight
-        if m.patterns:
-            for pat in m.patterns:
-                try:
-                    if re.search(pat, text):
-                        score += 2.0  # structural hit
-                except re.error:
-                    # ignore bad regex; could log if you add logging here
-                    pass
-
-        # simple regex presence (legacy field)
-        if m.regex:
-            try:
-                if re.search(m.regex, text, flags=re.IGNORECASE):
-                    score += m.body_weight
-            except re.error:
-                pass
-
-        return score, first_kw
-
-    def classify(self, path: Path, text: str, rules: list[Rule], opts: Options | None = None) -> tuple[
-        Optional[Rule], Optional[str]]:
+        return RuleEngine([rule]).score_text(text, title_n)[0]
+
+    def _engine_for(self, rules: list[Rule], engine: RuleEngine | None) -> RuleEngine:
+        if engine is not None and engine.rules is rules:
+            return engine
+        # rules passed without their compiled engine: compile once and keep it
+        cached = getattr(self, "_engine", None)
+        if cached is None or cached.rules is not rules:
+            cached = self._engine = RuleEngine(rules)
+        return cached
+
+    def classify(self, path: Path, text: str, rules: list[Rule], opts: Options | None = None,
+                 engine: RuleEngine | None = None) -> tuple[Optional[Rule], Optional[str]]:
         ext = path.suffix.lower().lstrip(".")
         best: tuple[float, int, Optional[Rule], Optional[str]] = (-1.0, -10 ** 9, None, None)
         second: tuple[float, int, Optional[Rule], Optional[str]] = (-1.0, -10 ** 9, None, None)
 
-        for rule in rules:
+        engine = self._engine_for(rules, engine if engine is not None else (opts.engine if opts else None))
+        title_n = opts.title_lines if opts else 5  # fallback default
+        scan = engine.scan(text, title_n)
+
+        stats = self.rule_stats
+        cands = engine.candidates(ext)
+        stats["files"] += 1
+        stats["skipped_filetype"] += len(rules) - len(cands)
+        for i in cands:
+            rule = rules[i]
             m = rule.match
-            if m.filetypes and ext not in m.filetypes:
+            bound = engine.max_scores[i]
+            if bound < m.min_score:
+                stats["pruned_min_score"] += 1
                 continue
-            title_n = opts.title_lines if opts else 5  # fallback default
-            score, first_kw = self._score_rule(text, rule, title_n)
+            # can't displace the runner-up, so can't change best/second (and thus the tie check) either
+            if bound < second[0] or (bound == second[0] and m.priority <= second[1]):
+                stats["pruned_bound"] += 1
+                continue
+            stats["scored"] += 1
+            score, first_kw = engine.score(scan, i)
             if score >= m.min_score:
                 tup = (score, m.priority, rule, first_kw)
                 if (score > best[0]) or (score == best[0] and m.priority > best[1]):
@@ -307,44 +331,152 @@ class OrganizerService:
 
     # --- planning & execution
 
-    def plan(self, opts: Options) -> Iterable[Result]:
+    def _scan(self, opts: Options) -> list[tuple[Path, os.stat_result]]:
+        """Stat every inbox file once; files that vanish mid-scan are dropped."""
+        if opts.incremental_scan:
+            res = InboxScanner(opts.inbox).scan()
+            # FileStat carries the stat fields the cache and planner read (st_size, st_mtime[_ns], st_ino)
+            return cast("list[tuple[Path, os.stat_result]]", sorted(res.files.items()))
+        out = []
         for p in list_files(opts.inbox):
-            text = read_text_any(
-                p,
-                ocr_lang=opts.ocr_languages,
-                skip_large_mb=opts.skip_large_mb,
-                page_window_first=opts.page_window_first,
-                page_window_last=opts.page_window_last,
-                ocr_on_empty_text=opts.ocr_on_empty_text,
-            )
-            # compute & log ML prediction for Review UI
-            fh = _file_hash_for(p)
-            ml_label, ml_conf = ml_predict(text or p.name)
+            try:
+                out.append((p, p.stat()))
+            except FileNotFoundError:
+                continue
+        return out
+
+    def _extract(self, files: list[tuple[Path, os.stat_result]], opts: Options) -> Iterator[tuple[Path, str]]:
+        """
+        Yield (path, text) in input order. Cache hits are resolved up front in
+        bulk; only true misses reach the extractor (a process pool if configured).
+        """
+        kwargs = _read_kwargs(opts)
+        cached = default_cache().get_many(files, opts.cache_key)
+        misses = [p for p, _ in files if p not in cached]
+        kwargs["lookup"] = False
+
+        if opts.workers <= 1 or len(misses) < 2:
+            for p, st in files:
+                text = cached.get(p)
+                yield p, (text if text is not None else read_text_any(p, st=st, **kwargs))
+            return
+
+        # never fork: this process runs threads (sample writer, lease renewal, web jobs) whose
+        # locks a forked child could inherit mid-held; forkserver/spawn start clean workers
+        ctx = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+        ex = ProcessPoolExecutor(max_workers=opts.workers, mp_context=ctx, initializer=init_extract_worker)
+        try:
+            # map() keeps input order, so results stay deterministic regardless of which worker finishes first
+            extracted = ex.map(partial(extract_one, kwargs=kwargs), misses)
+            for p, _ in files:
+                text = cached.get(p)
+                yield p, (text if text is not None else next(extracted))
+        finally:
+            # don't sit on the rest of the backlog if the consumer stopped early
+            ex.shutdown(wait=True, cancel_futures=True)
+
+    def plan(self, opts: Options) -> Iterable[Result]:
+        yield from self.plan_files(self._scan(opts), opts)
+
+    def plan_paths(self, paths: Iterable[Path], opts: Options) -> Iterable[Result]:
+        """Plan just these files (e.g. the watcher's settled batch) instead of the whole inbox."""
+        files = []
+        for p in paths:
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue  # already moved/deleted by someone else
+            if p.is_file():
+                files.append((p, st))
+        yield from self.plan_files(files, opts)
+
+    def plan_files(self, files: list[tuple[Path, os.stat_result]], opts: Options) -> Iterable[Result]:
+        self.rule_stats = Counter()
+        stats = dict(files)
+        chunk: list[tuple[Path, str]] = []
+        for item in self._extract(files, opts):
+            chunk.append(item)
+            if len(chunk) >= opts.ml_batch:
+                yield from self._plan_chunk(chunk, opts, stats)
+                chunk = []
+        if chunk:
+            yield from self._plan_chunk(chunk, opts, stats)
+
+        st = self.rule_stats
+        get_log().info("STATS  plan files=%d scored=%d pruned_bound=%d pruned_min_score=%d skipped_filetype=%d",
+                       st["files"], st["scored"], st["pruned_bound"], st["pruned_min_score"], st["skipped_filetype"])
+
+    def _plan_chunk(self, chunk: list[tuple[Path, str]], opts: Options,
+                    stats: dict[Path, os.stat_result]) -> Iterable[Result]:
+        # no mkdir here: planning leaves the archive untouched, _apply() creates dst dirs on execute
+        # one vectorized predict for the chunk; classify()'s ML fallback then hits the prediction cache
+        preds = ml_predict_many([text or p.name for p, text in chunk])
+        for (p, text), (ml_label, ml_conf) in zip(chunk, preds):
+            # log ML prediction for Review UI
+            fh = _file_hash_for(p, opts.cache_key)
             _log_ml_sample(fh, p, text, ml_label, ml_conf)
 
-            rule, first_kw = self.classify(p, text, opts.rules)
+            rule, first_kw = self.classify(p, text, opts.rules, engine=opts.engine)
             if not rule:
                 # Send to Review folder instead of pure no_match
-                ts = datetime.fromtimestamp(p.stat().st_mtime)
+                ts = datetime.fromtimestamp(stats[p].st_mtime)
                 review_dir = opts.archive_root / "_Review" / f"{ts.year}-{ts.month:02d}-{ts.day:02d}"
-                review_dir.mkdir(parents=True, exist_ok=True)
                 dst = next_available(review_dir / p.name)
-                yield Result(src=p, dst=dst, rule=None, ok=True, reason="review", text_excerpt=text[:200])
+                yield Result(src=p, dst=dst, rule=None, ok=True, reason="review", text_excerpt=text[:200],
+                             fingerprint=fingerprint(stats[p]))
                 continue
-            ts = datetime.fromtimestamp(p.stat().st_mtime)
+            ts = datetime.fromtimestamp(stats[p].st_mtime)
             dst_dir = Path(render_template(rule.action.move_to, original=p.name, date=ts, archive_root=opts.archive_root, first_keyword=first_kw))
-            dst_dir.mkdir(parents=True, exist_ok=True)
             new_name = render_template(rule.action.rename, original=p.stem, date=ts, archive_root=opts.archive_root, first_keyword=first_kw) + p.suffix
             dst = next_available(dst_dir / new_name)
-            yield Result(src=p, dst=dst, rule=rule.name, ok=True, text_excerpt=text[:200])
+            yield Result(src=p, dst=dst, rule=rule.name, ok=True, text_excerpt=text[:200],
+                         fingerprint=fingerprint(stats[p]))
 
     def execute(self, opts: Options) -> Iterable[Result]:
+        yield from self._apply(self.plan(opts), opts)
+
+    def execute_plan(self, planned: Iterable[Result], opts: Options) -> Iterable[Result]:
+        """
+        Apply a precomputed plan (a plan file, the CLI's shown plan, the web
+        snapshot) without extracting or classifying anything again.
+        """
+        yield from self._apply(self._recheck(planned), opts)
+
+    def _recheck(self, planned: Iterable[Result]) -> Iterator[Result]:
+        # only the fingerprint is re-checked; a file that changed since planning is left for the next plan
+        for r in planned:
+            if not r.dst or r.reason == "no_match":
+                yield r
+                continue
+            try:
+                st = r.src.stat()
+            except FileNotFoundError:
+                yield replace(r, ok=False, reason="stale_plan: source missing")
+                continue
+            if r.fingerprint and fingerprint(st) != r.fingerprint:
+                yield replace(r, ok=False, reason="stale_plan: source changed")
+                continue
+            # lazy: the previous result has been moved by _apply before this runs,
+            # so two planned files with the same target name don't collide
+            yield replace(r, dst=next_available(r.dst))
+
+    def process_paths(self, paths: Iterable[Path], opts: Options) -> Iterable[Result]:
+        """Plan and execute only the given files."""
+        yield from self._apply(self.plan_paths(paths, opts), opts)
+
+    def _apply(self, planned: Iterable[Result], opts: Options) -> Iterable[Result]:
         log = get_log()
-        for r in self.plan(opts):
+        for r in planned:
             if not r.dst or r.reason == "no_match":
                 log.info("SKIP   %s (%s)", r.src, r.reason or "no_match")
                 yield r
                 continue
+            if not r.ok:
+                # rejected before applying (e.g. stale plan entry): report, don't move
+                log.info("SKIP   %s (%s)", r.src, r.reason)
+                yield r
+                continue
             try:
                 if not opts.dry_run:
                     r.dst.parent.mkdir(parents=True, exist_ok=True)
@@ -373,6 +505,7 @@ class OrganizerService:
                     ok=False,
                     reason=str(e),
                     text_excerpt=r.text_excerpt,
+                    fingerprint=r.fingerprint,
                 )
 
 #docker exec - it de2d4e577153 sh - lc "nas-organizer -c /app/rules.yaml --trace | sed -n '1,200p'"
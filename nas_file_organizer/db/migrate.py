@@ -86,4 +86,7 @@ def run():
     con = sqlite3.connect(DB_PATH)
     con.executescript(sql)
     con.commit()
+    # relabel tracking for incremental training (column + triggers, idempotent)
+    from nas_file_organizer.ml.utils import ensure_label_seq
+    ensure_label_seq(con)
     con.close()
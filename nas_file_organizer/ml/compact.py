@@ -0,0 +1,166 @@
+# nas_file_organizer/ml/compact.py
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# 2**20 hashed features; the vectorizer itself holds no vocabulary
+HASH_FEATURES = int(os.environ.get("MODEL_HASH_FEATURES", str(2 ** 20)))
+# hashed columns must occur in this many training documents (the vocabulary pipeline's min_df);
+# hash collisions merge rare n-grams, so raising it narrows (and speeds up) the compact fit
+MIN_DF = int(os.environ.get("MODEL_MIN_DF", "2"))
+
+
+def hashing_vectorizer(n_features: int = HASH_FEATURES) -> HashingVectorizer:
+    # raw counts; idf weighting and l2 norm are applied afterwards (TfidfTransformer at train time)
+    return HashingVectorizer(ngram_range=(1, 2), n_features=n_features,
+                             alternate_sign=False, norm=None)
+
+
+class MinDfSelector(BaseEstimator, TransformerMixin):
+    """
+    Keep the hashed columns that occur in at least min_df training documents,
+    like TfidfVectorizer(min_df=...) does for a vocabulary. Sits between the
+    hasher and the TfidfTransformer, so idf, l2 norm and the classifier only
+    see the selected columns and the fit is as narrow as the pipeline format's.
+    """
+
+    def __init__(self, min_df: int = MIN_DF):
+        self.min_df = min_df
+
+    def fit(self, X, y=None) -> "MinDfSelector":
+        X = sparse.csr_matrix(X)
+        df = np.bincount(X.indices, minlength=X.shape[1])
+        cols = np.flatnonzero(df >= self.min_df)
+        if not len(cols):      # tiny corpora: fall back to every column seen
+            cols = np.flatnonzero(df)
+        self.columns_ = cols.astype(np.int32)
+        return self
+
+    def transform(self, X):
+        return sparse.csr_matrix(X)[:, self.columns_]
+
+
+class CompactClassifier:
+    """
+    Inference-only form of HashingVectorizer -> TfidfTransformer -> LogisticRegression.
+
+    All state lives in flat float32/int32 numpy arrays over the k features that
+    survived pruning: their sorted column ids, idf values and coefficients.
+    Every other column shares one idf value (idf_rest), which only enters the
+    l2 norm of a document. Columns outside the MinDfSelector selection never
+    entered the norm at train time (idf_rest 0), so with prune=0 this is
+    exact; pruned features get the mean idf of the pruned set. Pickled with joblib
+    (uncompressed), the arrays can be loaded with mmap_mode="r" and are then
+    shared through the page cache by every process serving the model.
+    Exposes classes_ / predict_proba / predict like the sklearn pipeline.
+    """
+
+    def __init__(self, n_features: int, idf: np.ndarray, features: np.ndarray,
+                 coef: np.ndarray, intercept: np.ndarray, classes: Sequence[str],
+                 idf_rest: float = 1.0):
+        self.n_features = n_features
+        self.idf = idf                  # (k,) float32, idf of the kept features
+        self.idf_rest = idf_rest        # idf used for every other column
+        self.features = features        # (k,) int32, kept feature columns, ascending
+        self.coef = coef                # (n_coef, k) float32; n_coef == 1 for binary
+        self.intercept = intercept      # (n_coef,) float32
+        self.classes_ = np.asarray(classes)
+        self._vec = None
+
+    @classmethod
+    def from_pipeline(cls, pipe, min_weight: float = 0.0) -> "CompactClassifier":
+        """Export a fitted hashing pipeline; features whose |coef| never exceeds min_weight are dropped."""
+        hv = pipe.named_steps["hash"]
+        select = pipe.named_steps.get("select")
+        tfidf = pipe.named_steps["tfidf"]
+        clf = pipe.named_steps["clf"]
+        coef = np.asarray(clf.coef_)
+        keep = np.flatnonzero(np.abs(coef).max(axis=0) > min_weight).astype(np.int32)
+        idf = np.asarray(tfidf.idf_)           # over the selected columns, if there is a selector
+        if select is not None:
+            dropped = np.delete(idf, keep)
+            idf_rest = float(dropped.mean()) if len(dropped) else 0.0
+            features = select.columns_[keep]
+        else:
+            idf_rest, features = _rest_idf(idf, keep), keep
+        return cls(n_features=hv.n_features,
+                   idf=np.ascontiguousarray(idf[keep], dtype=np.float32),
+                   features=np.ascontiguousarray(features, dtype=np.int32),
+                   coef=np.ascontiguousarray(coef[:, keep], dtype=np.float32),
+                   intercept=np.asarray(clf.intercept_, dtype=np.float32),
+                   classes=list(clf.classes_),
+                   idf_rest=idf_rest)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_vec"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "idf_rest" not in state:
+            # artifacts written before the idf was stored per kept feature
+            full = np.asarray(state["idf"])
+            state["idf_rest"] = _rest_idf(full, np.asarray(state["features"]))
+            state["idf"] = np.ascontiguousarray(full[state["features"]], dtype=np.float32)
+        self.__dict__.update(state)
+
+    def _vectorizer(self) -> HashingVectorizer:
+        if self._vec is None:
+            self._vec = hashing_vectorizer(self.n_features)
+        return self._vec
+
+    def decision_function(self, texts: Sequence[str]) -> np.ndarray:
+        return self._decision(self._vectorizer().transform(texts))
+
+    def _decision(self, X) -> np.ndarray:
+        # works on the document's non-zeros only: no n_features-wide temporaries
+        X = sparse.csr_matrix(X)
+        n = X.shape[0]
+        rows = np.repeat(np.arange(n), np.diff(X.indptr))
+        cols = X.indices
+        k = len(self.features)
+        pos = np.minimum(np.searchsorted(self.features, cols), max(k - 1, 0))
+        kept = (self.features[pos] == cols) if k else np.zeros(len(cols), dtype=bool)
+        # tf * idf, then the l2 norm over all of the document's features, as at train time
+        w = X.data.astype(np.float32) * np.where(kept, self.idf[pos] if k else 0, self.idf_rest)
+        norms = np.sqrt(np.bincount(rows, weights=w * w, minlength=n))
+        w = w / np.where(norms > 0, norms, 1.0)[rows]
+        # gather only the coefficient columns the documents hit, summed per row
+        rows, w, cols = rows[kept], w[kept], self.coef[:, pos[kept]]
+        z = np.stack([np.bincount(rows, weights=c * w, minlength=n) for c in cols], axis=1)
+        return z + self.intercept
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return self._proba(self.decision_function(texts))
+
+    def predict_counts(self, X) -> List[str]:
+        """Predict from raw hashed counts (e.g. FeatureStore rows) instead of text."""
+        return list(self.classes_[self._proba(self._decision(X)).argmax(axis=1)])
+
+    @staticmethod
+    def _proba(z: np.ndarray) -> np.ndarray:
+        if z.shape[1] == 1:
+            p = 1.0 / (1.0 + np.exp(-z[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        z = z - z.max(axis=1, keepdims=True)
+        e = np.exp(z)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Sequence[str]) -> List[str]:
+        return list(self.classes_[self.predict_proba(texts).argmax(axis=1)])
+
+    def nbytes(self) -> int:
+        return int(self.idf.nbytes + self.features.nbytes + self.coef.nbytes + self.intercept.nbytes)
+
+
+def _rest_idf(idf: np.ndarray, keep: np.ndarray) -> float:
+    """Shared idf for columns outside keep: the pruned seen features' mean, else the unseen-term idf."""
+    unseen = float(idf.max())     # smooth idf of a term with df=0: the largest value
+    dropped = np.ones(len(idf), dtype=bool)
+    dropped[keep] = False
+    seen_dropped = idf[dropped & (idf < unseen)]
+    return float(seen_dropped.mean()) if len(seen_dropped) else unseen
@@ -0,0 +1,157 @@
+# nas_file_organizer/ml/feature_store.py
+import hashlib
+import os
+import sqlite3
+from typing import List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .compact import HASH_FEATURES, hashing_vectorizer
+from .utils import normalize_text, infer_label_from_path, ARCHIVE_ROOT_DEFAULT, ClassReservoir, USABLE_SAMPLE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ml_features (
+  file_hash  TEXT PRIMARY KEY,
+  sample_sig TEXT NOT NULL,      -- hash of the sample text (or path, without text) the row was built from
+  sample_mark TEXT,              -- cheap change marker of that sample (see _MARK)
+  n_features INTEGER NOT NULL,
+  idx        BLOB NOT NULL,      -- int32 column indices
+  val        BLOB NOT NULL,      -- float32 raw term counts
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# rows vectorized per HashingVectorizer.transform / executemany
+BATCH = 500
+
+# rowid changes on every INSERT OR REPLACE (SampleWriter), updated_at on every UPDATE (review
+# moves); a differing mark only makes a row a candidate, the content hash decides the rebuild
+_MARK = "s.rowid || ':' || COALESCE(s.updated_at, '') || ':' || LENGTH(COALESCE(s.text, ''))"
+
+
+def _feature_sig(text, path) -> str:
+    # what the row is built from: the text, or the path when there is none (see _sample_text)
+    src = f"t:{text}" if text else f"p:{path or ''}"
+    return hashlib.blake2b(src.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def _sample_text(text: str, path: str) -> str:
+    # same weak fallback as collect_training_set for samples without text
+    if not text:
+        text = f"{os.path.basename(path)} {os.path.basename(os.path.dirname(path))}"
+    return normalize_text(text)
+
+
+class FeatureStore:
+    """
+    Hashed raw-count feature rows, one per ml_samples.file_hash, kept in SQLite.
+
+    sync() vectorizes only samples that are new or whose text changed since
+    their row was built: SQL compares a cheap change marker, and only rows
+    whose marker moved are hashed (text, or path without text) to confirm it.
+    The
+    normalize_text + hashing cost of a sample is paid once instead of on every
+    retrain. training_matrix() stacks the stored rows straight into a CSR matrix
+    for the hashing model formats (compact / online).
+    """
+
+    def __init__(self, conn: sqlite3.Connection, n_features: int = HASH_FEATURES):
+        self.conn = conn
+        self.n_features = n_features
+        conn.executescript(SCHEMA)
+        if "sample_mark" not in {r[1] for r in conn.execute("PRAGMA table_info(ml_features)")}:
+            conn.execute("ALTER TABLE ml_features ADD COLUMN sample_mark TEXT")
+
+    def sync(self) -> dict:
+        """Build rows for new/changed samples, drop rows whose sample is gone. Returns counts."""
+        con = self.conn
+        hv = hashing_vectorizer(self.n_features)
+        # same sample filter as collect_training_set: gone or unusable samples lose their row
+        deleted = con.execute(f"""
+            DELETE FROM ml_features WHERE file_hash NOT IN
+              (SELECT s.file_hash FROM ml_samples AS s WHERE {USABLE_SAMPLE})
+        """).rowcount
+        # candidates: no row, other width, or a moved marker; collected first, rows are rewritten as we go
+        cands = [r[0] for r in con.execute(f"""
+            SELECT s.file_hash
+            FROM ml_samples AS s
+            LEFT JOIN ml_features AS f ON f.file_hash = s.file_hash
+            WHERE ({USABLE_SAMPLE})
+              AND (f.file_hash IS NULL OR f.n_features <> ? OR f.sample_mark IS NOT {_MARK})
+        """, (self.n_features,))]
+        built = 0
+        for start in range(0, len(cands), BATCH):
+            chunk = cands[start:start + BATCH]
+            rows = con.execute(f"""
+                SELECT s.file_hash, s.path, s.text, {_MARK}, f.sample_sig, f.n_features
+                FROM ml_samples AS s LEFT JOIN ml_features AS f ON f.file_hash = s.file_hash
+                WHERE s.file_hash IN ({",".join("?" * len(chunk))})
+            """, chunk).fetchall()
+            stale, same = [], []
+            for fh, path, text, mark, old_sig, old_n in rows:
+                sig = _feature_sig(text, path)
+                if old_n == self.n_features and old_sig == sig:
+                    same.append((mark, fh))        # touched but unchanged: only the marker moves
+                else:
+                    stale.append((fh, path, text, mark, sig))
+            con.executemany("UPDATE ml_features SET sample_mark=? WHERE file_hash=?", same)
+            if not stale:
+                continue
+            X = hv.transform([_sample_text(r[2] or "", r[1] or "") for r in stale]).tocsr()
+            X.sort_indices()
+            out = []
+            for i, r in enumerate(stale):
+                a, b = X.indptr[i], X.indptr[i + 1]
+                out.append((r[0], r[4], r[3], self.n_features,
+                            X.indices[a:b].astype(np.int32).tobytes(),
+                            X.data[a:b].astype(np.float32).tobytes()))
+            con.executemany("""
+                INSERT INTO ml_features(file_hash, sample_sig, sample_mark, n_features, idx, val, updated_at)
+                VALUES(?,?,?,?,?,?,CURRENT_TIMESTAMP)
+                ON CONFLICT(file_hash) DO UPDATE SET sample_sig=excluded.sample_sig,
+                  sample_mark=excluded.sample_mark, n_features=excluded.n_features,
+                  idx=excluded.idx, val=excluded.val, updated_at=excluded.updated_at
+            """, out)
+            built += len(stale)
+        con.commit()
+        return {"built": built, "deleted": max(deleted, 0)}
+
+    def training_matrix(self, per_class_cap: int = 0,
+                        seed: int = 42) -> Tuple[sparse.csr_matrix, List[str], List[str]]:
+        """
+        (X, labels, file_hashes) for every labelled sample, with the same label
+        rules, order and per-class cap as collect_training_set: human label, else
+        the archive folder the file sits in; unlabelled samples are skipped.
+        """
+        cur = self.conn.execute("""
+            SELECT f.file_hash, f.idx, f.val, s.path, L.label AS human_label
+            FROM ml_features AS f
+            JOIN ml_samples AS s ON s.file_hash = f.file_hash
+            LEFT JOIN ml_labels AS L ON L.file_hash = f.file_hash
+            WHERE f.n_features = ?
+            ORDER BY s.updated_at DESC, s.created_at DESC
+        """, (self.n_features,))
+        res = ClassReservoir(per_class_cap, seed)
+        for fh, idx, val, path, human in cur:
+            label = human or infer_label_from_path(path or "", ARCHIVE_ROOT_DEFAULT)
+            if label:
+                res.add(label, (fh, idx, val))
+
+        indptr = [0]
+        idx_parts, val_parts = [], []
+        labels: List[str] = []
+        hashes: List[str] = []
+        for label, (fh, idx, val) in res.items():
+            ind = np.frombuffer(idx, dtype=np.int32)
+            idx_parts.append(ind)
+            val_parts.append(np.frombuffer(val, dtype=np.float32))
+            indptr.append(indptr[-1] + len(ind))
+            labels.append(label)
+            hashes.append(fh)
+        X = sparse.csr_matrix(
+            (np.concatenate(val_parts) if val_parts else np.zeros(0, np.float32),
+             np.concatenate(idx_parts) if idx_parts else np.zeros(0, np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(labels), self.n_features))
+        return X, labels, hashes
@@ -0,0 +1,121 @@
+# nas_file_organizer/ml/holder.py
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("nas_organizer.model")
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "/data/model.pkl")
+# how often (seconds) current() re-stats the model file
+CHECK_SECONDS = float(os.environ.get("MODEL_CHECK_SECONDS", "5"))
+# numpy arrays in the artifact are mapped read-only and shared via the page cache ("" = load into RAM)
+MMAP_MODE = os.environ.get("MODEL_MMAP", "r") or None
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """One immutable generation of the model; callers keep it for the duration of a batch."""
+    pipeline: Any
+    version: str        # path@mtime_ns:size:inode, changes on every retrain
+    loaded_at: float
+
+
+def _signature(path: str) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{path}@{st.st_mtime_ns}:{st.st_size}:{st.st_ino}"
+
+
+class ModelHolder:
+    """
+    Holds the current model and swaps in a new one when the file on disk changes.
+
+    current() is cheap: it re-stats the file at most every check_seconds and
+    only loads when the signature moved. The check and the swap run under
+    _load_lock, so concurrent callers never load the same file twice; while
+    one caller holds it, the others return the generation already being
+    served instead of waiting (only the very first load makes them wait).
+    The new LoadedModel is published with a single reference assignment, so a
+    classification that already fetched the old generation finishes on it. A
+    file that fails to load (e.g. caught half-written) keeps the old model in
+    place and is retried on the next check.
+    """
+
+    def __init__(self, path: str = MODEL_PATH, check_seconds: float = CHECK_SECONDS):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._model: Optional[LoadedModel] = None
+        self._next_check = 0.0
+        self._load_lock = threading.Lock()
+        self._failed_sig: Optional[str] = None
+        self.stats: Dict[str, Any] = {"reloads": 0, "reload_failures": 0, "last_error": None,
+                                      "last_load_seconds": None}
+
+    def current(self) -> Optional[LoadedModel]:
+        if time.monotonic() >= self._next_check and self._load_lock.acquire(blocking=self._model is None):
+            try:
+                # re-checked under the lock: the caller ahead of us may have just done it
+                if time.monotonic() >= self._next_check:
+                    self._refresh_locked(False)
+            finally:
+                self._load_lock.release()
+        return self._model
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload if the model file changed (or always, with force). Returns True on a swap."""
+        with self._load_lock:
+            return self._refresh_locked(force)
+
+    def _refresh_locked(self, force: bool) -> bool:
+        self._next_check = time.monotonic() + self.check_seconds
+        sig = _signature(self.path)
+        cur = self._model
+        if sig is None:
+            return False  # keep serving the last good model if the file vanished
+        if not force and ((cur is not None and cur.version == sig) or sig == self._failed_sig):
+            return False
+        t0 = time.perf_counter()
+        try:
+            import joblib  # deferred: pulls in numpy/scipy, only needed once a model exists
+            pipe = joblib.load(self.path, mmap_mode=MMAP_MODE)["pipeline"]
+        except Exception as e:
+            self._failed_sig = sig
+            self.stats["reload_failures"] += 1
+            self.stats["last_error"] = f"{type(e).__name__}: {e}"
+            log.warning("MODEL  reload of %s failed, keeping %s: %s",
+                        self.path, cur.version if cur else "no model", e)
+            return False
+        self._failed_sig = None
+        self.stats["last_load_seconds"] = round(time.perf_counter() - t0, 3)
+        self._model = LoadedModel(pipeline=pipe, version=sig, loaded_at=time.time())
+        if cur is not None:
+            self.stats["reloads"] += 1
+            log.info("MODEL  reloaded %s (was %s) in %.2fs", sig, cur.version, self.stats["last_load_seconds"])
+        else:
+            log.info("MODEL  loaded %s in %.2fs", sig, self.stats["last_load_seconds"])
+        return True
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        m = self._model
+        return {**self.stats,
+                "version": m.version if m else None,
+                "loaded_at": m.loaded_at if m else None}
+
+
+_default: Optional[ModelHolder] = None
+_default_lock = threading.Lock()
+
+
+def default_holder() -> ModelHolder:
+    """Process-wide holder for MODEL_PATH."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ModelHolder()
+    return _default
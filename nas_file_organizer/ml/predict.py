@@ -1,6 +1,7 @@
 import os
 import joblib
 from typing import Tuple
+from .holder import MMAP_MODE
 from .utils import normalize_text
 
 
@@ -9,7 +10,7 @@ MODEL_PATH = os.environ.get("MODEL_PATH", "/data/model.pkl")
 
 class MLPredictor:
     def __init__(self, model_path: str = MODEL_PATH):
-        obj = joblib.load(model_path)
+        obj = joblib.load(model_path, mmap_mode=MMAP_MODE)
         self.pipe = obj["pipeline"]
     def predict(self, text: str) -> Tuple[str, float]:
         text = normalize_text(text)
@@ -4,70 +4,224 @@ import os
 import joblib
 import numpy as np
 from collections import Counter
-from typing import Tuple, Dict, Any
+from typing import Callable, Tuple, Dict, Any, Optional
 
 from sklearn.pipeline import Pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.preprocessing import Normalizer
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, f1_score, classification_report
 
-from .utils import connect_db, collect_training_set, upsert_model_registry
+from .utils import (connect_db, collect_training_set, collect_new_samples, high_water_marks,
+                    registry_entry, upsert_model_registry, reset_peak_rss, peak_rss_mb, record_metric)
+from .compact import CompactClassifier, MinDfSelector, hashing_vectorizer
+from .feature_store import FeatureStore
 
 DEFAULT_DB      = os.environ.get("CACHE_DB", "/data/cache.db")
 DEFAULT_OUT     = os.environ.get("MODEL_OUT", "/data/model.pkl")
 DEFAULT_VERSION = os.environ.get("MODEL_VERSION", "tfidf-logreg-v1")
+# compact = hashing vectorizer + flat, mmap-able coefficient arrays (see ml/compact.py).
+# Smaller, faster to load and to predict, but slower to fit than the vocabulary pipeline:
+# hash collisions keep more columns past min_df (benchmarks/bench_model.py prints both fits)
+DEFAULT_COMPACT = os.environ.get("MODEL_COMPACT", "0").lower() in ("1", "true", "yes")
+# features whose |coef| <= MODEL_PRUNE in every class are dropped from the compact artifact
+DEFAULT_PRUNE   = float(os.environ.get("MODEL_PRUNE", "0.05"))
+# incremental = hashing vectorizer + SGD, updated in place with only the newly labelled samples
+DEFAULT_INCREMENTAL = os.environ.get("MODEL_INCREMENTAL", "0").lower() in ("1", "true", "yes")
+# after this many incremental updates the next run does a full refit
+FULL_EVERY = int(os.environ.get("MODEL_FULL_EVERY", "20"))
+# keep at most this many samples per class (reservoir-sampled) on full fits; 0 = all
+DEFAULT_CLASS_CAP = int(os.environ.get("MODEL_CLASS_CAP", "0"))
+# formats whose first step is the stateless hasher; these train from FeatureStore rows
+HASHED_FORMATS = ("compact", "online")
 
-def build_pipeline() -> Pipeline:
+def build_pipeline(fmt: str = "pipeline") -> Pipeline:
+    if fmt == "online":
+        # stateless features (no vocabulary, no idf) so partial_fit can keep extending the model
+        return Pipeline([
+            ("hash", hashing_vectorizer()),
+            ("norm", Normalizer()),
+            ("clf",  SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42))
+        ])
+    if fmt == "compact":
+        return Pipeline([
+            ("hash",   hashing_vectorizer()),
+            ("select", MinDfSelector()),      # fit only on columns in >= 2 docs, like the vocabulary pipeline
+            ("tfidf",  TfidfTransformer()),
+            ("clf",    LogisticRegression(max_iter=2000, class_weight="balanced"))
+        ])
     return Pipeline([
         ("tfidf", TfidfVectorizer(ngram_range=(1, 2), min_df=2)),
         ("clf",   LogisticRegression(max_iter=2000, class_weight="balanced"))
     ])
 
-def train_and_save(db_path: str = DEFAULT_DB, out_path: str = DEFAULT_OUT,
-                   version: str = DEFAULT_VERSION) -> Dict[str, Any]:
+def fit_model(data, labels, fmt: str = "pipeline", prune: float = 0.0, hashed: bool = False):
+    """
+    Fit and return the object stored as "pipeline": a sklearn Pipeline or a CompactClassifier.
+    With hashed=True, data are raw-count rows (FeatureStore) and the hasher step is skipped.
+    """
+    pipe = build_pipeline(fmt)
+    (pipe[1:] if hashed else pipe).fit(data, labels)
+    return CompactClassifier.from_pipeline(pipe, min_weight=prune) if fmt == "compact" else pipe
+
+def _predict(model, data, hashed: bool):
+    if not hashed:
+        return model.predict(data)
+    return model.predict_counts(data) if isinstance(model, CompactClassifier) else model[1:].predict(data)
+
+def save_model(obj: Dict[str, Any], out_path: str) -> None:
+    """Write to a temp file and rename over out_path, so running processes never load a partial pickle."""
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp = f"{out_path}.tmp{os.getpid()}"
+    try:
+        joblib.dump(obj, tmp)  # uncompressed, so numpy arrays can be loaded with mmap_mode
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _load_online(out_path: str) -> Optional[Pipeline]:
+    try:
+        obj = joblib.load(out_path)
+    except Exception:
+        return None
+    return obj["pipeline"] if obj.get("format") == "online" else None
+
+def update_incremental(db_path: str = DEFAULT_DB, out_path: str = DEFAULT_OUT,
+                       version: str = DEFAULT_VERSION) -> Optional[Dict[str, Any]]:
+    """
+    Fold the samples labelled or corrected since the registry's high-water
+    marks into the saved online model with one partial_fit. Accuracy is
+    measured on those samples before the model learns them.
+
+    Returns None when a full refit is needed instead: no online model yet,
+    FULL_EVERY updates since the last full fit, or a label the model has never seen.
+    """
     conn = connect_db(db_path)
-    texts, labels, _ = collect_training_set(conn)
+    reg = registry_entry(conn, version)
+    if reg is None or reg["label_hwm"] is None or (reg["increments"] or 0) >= FULL_EVERY:
+        return None
+    pipe = _load_online(out_path)
+    if pipe is None:
+        return None
+    clf = pipe.named_steps["clf"]
+
+    label_hwm, correction_hwm = high_water_marks(conn)  # read first: rows added meanwhile go to the next run
+    texts, labels, _ = collect_new_samples(conn, reg["label_hwm"], reg["correction_hwm"] or 0)
+    base = {"version": version, "out": out_path, "format": "online", "mode": "incremental",
+            "samples": len(texts), "classes": dict(Counter(labels))}
     if not texts:
+        return {**base, "size_bytes": os.path.getsize(out_path), "accuracy": reg["accuracy"] or 0.0,
+                "macro_f1": reg["macro_f1"] or 0.0, "report": "No new labels since the last update."}
+    if set(labels) - set(clf.classes_):
+        return None
+
+    # full fits train on the FeatureStore's float32 rows; SGD's partial_fit needs the same dtype
+    X = pipe[:-1].transform(texts).astype(clf.coef_.dtype)
+    yhat = clf.predict(X)
+    acc = accuracy_score(labels, yhat)
+    macro = f1_score(labels, yhat, average="macro")
+    clf.partial_fit(X, labels)
+
+    increments = (reg["increments"] or 0) + 1
+    save_model({"pipeline": pipe, "classes": sorted(map(str, clf.classes_)), "format": "online"}, out_path)
+    upsert_model_registry(conn, version, out_path, float(acc), float(macro),
+                          notes=f"incremental update {increments}/{FULL_EVERY}; +{len(texts)} samples",
+                          label_hwm=label_hwm, correction_hwm=correction_hwm,
+                          mode="incremental", increments=increments)
+    return {**base, "size_bytes": os.path.getsize(out_path), "accuracy": float(acc), "macro_f1": float(macro),
+            "report": f"Prequential accuracy on {len(texts)} new samples (scored before partial_fit)."}
+
+def train_and_save(db_path: str = DEFAULT_DB, out_path: str = DEFAULT_OUT,
+                   version: str = DEFAULT_VERSION, compact: bool = DEFAULT_COMPACT,
+                   prune: float = DEFAULT_PRUNE, incremental: bool = DEFAULT_INCREMENTAL,
+                   full: bool = False, per_class_cap: int = DEFAULT_CLASS_CAP,
+                   progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Train (see _train), then report the run's peak RSS in the result and in ml_metrics.
+    progress, if given, is called with a short description of each stage.
+    """
+    exact = reset_peak_rss()
+    res = _train(db_path, out_path, version, compact, prune, incremental, full, per_class_cap,
+                 progress or (lambda msg: None))
+    # without a reset (non-Linux) this is the process-lifetime peak
+    res["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    res["peak_rss_exact"] = exact
+    try:
+        record_metric(connect_db(db_path), version, "train_peak_rss_mb", res["peak_rss_mb"])
+    except Exception:
+        pass  # metrics are best effort; the model is already saved
+    return res
+
+def _train(db_path: str, out_path: str, version: str, compact: bool, prune: float,
+           incremental: bool, full: bool, per_class_cap: int,
+           progress: Callable[[str], None]) -> Dict[str, Any]:
+    if incremental and not full:
+        progress("incremental update")
+        res = update_incremental(db_path, out_path, version)
+        if res is not None:
+            return res
+    conn = connect_db(db_path)
+    fmt = "online" if incremental else ("compact" if compact else "pipeline")
+    hashed = fmt in HASHED_FORMATS
+    label_hwm, correction_hwm = high_water_marks(conn)
+    progress("collecting samples")
+    if hashed:
+        # only new/changed samples are normalized and hashed; the rest come from the store
+        store = FeatureStore(conn)
+        synced = store.sync()
+        data, labels, _ = store.training_matrix(per_class_cap)
+    else:
+        synced = None
+        data, labels, _ = collect_training_set(conn, per_class_cap)
+    if not labels:
         raise RuntimeError("No training samples. Confirm/correct items in /review first.")
     if len(set(labels)) < 2:
         # Still allow saving a model, but warn: only one class so far.
-        pipe = build_pipeline().fit(texts, labels)
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        joblib.dump({"pipeline": pipe, "classes": sorted(set(labels))}, out_path)
+        pipe = fit_model(data, labels, fmt, prune, hashed)
+        save_model({"pipeline": pipe, "classes": sorted(set(labels)), "format": fmt}, out_path)
         upsert_model_registry(conn, version, out_path, accuracy=1.0, macro_f1=1.0,
-                              notes="trained on single class; add more labeled classes")
-        return {"version": version, "out": out_path, "samples": len(texts),
+                              notes="trained on single class; add more labeled classes",
+                              label_hwm=label_hwm, correction_hwm=correction_hwm)
+        return {"version": version, "out": out_path, "samples": len(labels), "format": fmt, "mode": "full",
+                "size_bytes": os.path.getsize(out_path), "features_synced": synced,
                 "classes": dict(Counter(labels)), "accuracy": 1.0, "macro_f1": 1.0,
                 "report": "Single-class training; add more classes for evaluation."}
 
+    progress(f"fitting on {len(labels)} samples")
     counts = Counter(labels)
     min_class = min(counts.values())
     do_stratify = min_class >= 2
 
-    if do_stratify and len(texts) >= 10:
+    if do_stratify and len(labels) >= 10:
         Xtr, Xte, ytr, yte = train_test_split(
-            texts, labels, test_size=0.2, random_state=42, stratify=labels
+            data, labels, test_size=0.2, random_state=42, stratify=labels
         )
-        pipe = build_pipeline().fit(Xtr, ytr)
-        yhat = pipe.predict(Xte)
+        pipe = fit_model(Xtr, ytr, fmt, prune, hashed)
+        yhat = _predict(pipe, Xte, hashed)
         acc = accuracy_score(yte, yhat)
         macro = f1_score(yte, yhat, average="macro")
         report = classification_report(yte, yhat, zero_division=0)
+        if fmt == "online":
+            # the held-out 20% would otherwise never be learned: later updates only see new labels
+            pipe.named_steps["clf"].partial_fit((pipe[1:-1] if hashed else pipe[:-1]).transform(Xte), yte)
     else:
         # Too few samples per class → train on ALL, skip holdout eval
-        pipe = build_pipeline().fit(texts, labels)
+        pipe = fit_model(data, labels, fmt, prune, hashed)
         acc = 1.0
         macro = 1.0
         report = "No holdout evaluation (too few samples per class)."
 
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    joblib.dump({"pipeline": pipe, "classes": sorted(set(labels))}, out_path)
+    progress("saving model")
+    save_model({"pipeline": pipe, "classes": sorted(set(labels)), "format": fmt}, out_path)
     upsert_model_registry(conn, version, out_path, float(acc), float(macro),
-                          notes=f"classes={sorted(set(set(labels)))}; min_class={min_class}")
+                          notes=f"classes={sorted(set(set(labels)))}; min_class={min_class}; format={fmt}",
+                          label_hwm=label_hwm, correction_hwm=correction_hwm)
     return {
-        "version": version, "out": out_path, "samples": len(texts),
-        "classes": dict(counts), "accuracy": float(acc), "macro_f1": float(macro),
+        "version": version, "out": out_path, "samples": len(labels), "format": fmt, "mode": "full",
+        "size_bytes": os.path.getsize(out_path), "features_synced": synced, "classes": dict(counts),
+        "accuracy": float(acc), "macro_f1": float(macro),
         "report": report
     }
 
@@ -76,12 +230,24 @@ def main():
     ap.add_argument("--db", default=DEFAULT_DB, help="Path to cache DB (CACHE_DB)")
     ap.add_argument("--out", default=DEFAULT_OUT, help="Model output path (MODEL_OUT)")
     ap.add_argument("--version", default=DEFAULT_VERSION, help="Model registry version")
+    ap.add_argument("--compact", action="store_true", default=DEFAULT_COMPACT,
+                    help="Export the compact hashing/mmap artifact (MODEL_COMPACT)")
+    ap.add_argument("--prune", type=float, default=DEFAULT_PRUNE,
+                    help="Compact only: drop features whose |coef| <= this (MODEL_PRUNE)")
+    ap.add_argument("--incremental", action="store_true", default=DEFAULT_INCREMENTAL,
+                    help="Online model, updated with only new labels/corrections (MODEL_INCREMENTAL)")
+    ap.add_argument("--full", action="store_true",
+                    help="With --incremental: refit from all samples now")
+    ap.add_argument("--class-cap", type=int, default=DEFAULT_CLASS_CAP,
+                    help="Reservoir-sample at most N documents per class (MODEL_CLASS_CAP)")
     args = ap.parse_args()
 
-    res = train_and_save(args.db, args.out, args.version)
-    print("Saved:", res["out"])
+    res = train_and_save(args.db, args.out, args.version, compact=args.compact, prune=args.prune,
+                         incremental=args.incremental, full=args.full, per_class_cap=args.class_cap)
+    print("Saved:", res["out"], f'({res["format"]}, {res["mode"]}, {res["size_bytes"]} bytes)')
     print("Samples:", res["samples"], "Classes:", res["classes"])
     print("Accuracy:", round(res["accuracy"], 4), "Macro-F1:", round(res["macro_f1"], 4))
+    print("Peak RSS:", res["peak_rss_mb"], "MiB")
     print(res["report"])
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 # nas_file_organizer/ml/utils.py
 import os
+import random
 import re
 import sqlite3
-from typing import Iterable, List, Tuple, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Optional
 
 ARCHIVE_ROOT_DEFAULT = os.environ.get("ARCHIVE_ROOT", "/data/archive")
 
@@ -30,56 +31,223 @@ def normalize_text(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
-def collect_training_set(conn: sqlite3.Connection) -> Tuple[List[str], List[str], List[str]]:
+# rows pulled from SQLite per fetchmany() while collecting training data
+FETCH_ROWS = 256
+# ml_samples rows (alias s) that can yield a training document: text, or at least a path
+USABLE_SAMPLE = "(s.text IS NOT NULL AND s.text <> '') OR (s.path IS NOT NULL AND s.path <> '')"
+
+class ClassReservoir:
     """
-    Build (texts, labels, file_hashes) by joining ml_samples (predictions/text)
-    with ml_labels (human-confirmed label). Falls back to inferring label from path
-    if a human label is missing but path is in the archive.
+    Keep at most `cap` items per label with reservoir sampling (Algorithm R),
+    so memory is bounded by classes x cap however many rows stream past.
+    cap <= 0 keeps everything, in arrival order.
     """
-    rows = conn.execute("""
+
+    def __init__(self, cap: int = 0, seed: int = 42):
+        self.cap = cap
+        self.rng = random.Random(seed)
+        self.seen: Dict[str, int] = {}
+        self.kept: Dict[str, list] = {}
+        self._all: list = []
+
+    def add(self, label: str, item) -> None:
+        if self.cap <= 0:
+            self._all.append((label, item))
+            return
+        n = self.seen.get(label, 0)
+        self.seen[label] = n + 1
+        bucket = self.kept.setdefault(label, [])
+        if n < self.cap:
+            bucket.append(item)
+        else:
+            j = self.rng.randrange(n + 1)
+            if j < self.cap:
+                bucket[j] = item
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        if self.cap <= 0:
+            yield from self._all
+            return
+        for label, bucket in self.kept.items():
+            for item in bucket:
+                yield label, item
+
+def iter_training_rows(conn: sqlite3.Connection) -> Iterator[Tuple[str, str, str]]:
+    """
+    Stream (file_hash, normalized_text, label) for every usable sample, newest
+    first, FETCH_ROWS at a time. Samples without a human label take the archive
+    folder they sit in; samples with neither are skipped.
+    """
+    cur = conn.execute(f"""
         SELECT s.file_hash, s.path, s.text,
                L.label AS human_label
         FROM ml_samples AS s
         LEFT JOIN ml_labels AS L ON L.file_hash = s.file_hash
-        WHERE (s.text IS NOT NULL AND s.text <> '')
-           OR (s.path IS NOT NULL AND s.path <> '')
+        WHERE {USABLE_SAMPLE}
         ORDER BY s.updated_at DESC, s.created_at DESC
-    """).fetchall()
+    """)
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        for r in rows:
+            pth = r["path"] or ""
+            label = r["human_label"] or infer_label_from_path(pth, ARCHIVE_ROOT_DEFAULT)
+            if not label:
+                # Skip items the user hasn’t labeled yet and we can’t infer.
+                continue
+            txt = r["text"] or ""
+            # If we don't have text (should be rare), use filename + parent folder as a weak text signal
+            if not txt:
+                base = os.path.basename(pth)
+                parent = os.path.basename(os.path.dirname(pth))
+                txt = f"{base} {parent}"
+            yield r["file_hash"], normalize_text(txt), label
+
+def collect_training_set(conn: sqlite3.Connection, per_class_cap: int = 0,
+                         seed: int = 42) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Build (texts, labels, file_hashes) by joining ml_samples (predictions/text)
+    with ml_labels (human-confirmed label). Falls back to inferring label from path
+    if a human label is missing but path is in the archive.
+
+    Rows are streamed; with per_class_cap > 0 each label keeps a uniform
+    random sample of at most that many documents.
+    """
+    res = ClassReservoir(per_class_cap, seed)
+    for fh, txt, label in iter_training_rows(conn):
+        res.add(label, (txt, fh))
 
     texts: List[str] = []
     labels: List[str] = []
     hashes: List[str] = []
+    for label, (txt, fh) in res.items():
+        texts.append(txt)
+        labels.append(label)
+        hashes.append(fh)
+    return texts, labels, hashes
 
-    for r in rows:
-        fh  = r["file_hash"]
-        txt = r["text"] or ""
-        pth = r["path"] or ""
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS mark (Linux clear_refs); False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
 
-        # If we don't have text (should be rare), use filename + parent folder as a weak text signal
-        if not txt:
-            base = os.path.basename(pth)
-            parent = os.path.basename(os.path.dirname(pth))
-            txt = f"{base} {parent}"
-        txt = normalize_text(txt)
+def peak_rss_mb() -> float:
+    """Peak resident set size since the last reset_peak_rss() (else since process start), in MiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except (ImportError, OSError):
+        return 0.0
 
-        label = r["human_label"] or infer_label_from_path(pth, ARCHIVE_ROOT_DEFAULT)
-        if not label:
-            # Skip items the user hasn’t labeled yet and we can’t infer.
-            continue
+def record_metric(conn: sqlite3.Connection, version: str, metric: str, value: float) -> None:
+    conn.execute("INSERT INTO ml_metrics(model_version, metric, value) VALUES(?,?,?)",
+                 (version, metric, float(value)))
+    conn.commit()
 
-        texts.append(txt)
-        labels.append(label)
-        hashes.append(fh)
+# ml_labels.updated_seq: bumped by triggers on every insert and every (re)label, including
+# upserts that keep the row (and its rowid) or set the label it already had
+_LABEL_SEQ_SQL = """
+CREATE INDEX IF NOT EXISTS idx_ml_labels_seq ON ml_labels(updated_seq);
+CREATE TRIGGER IF NOT EXISTS trg_ml_labels_seq_ins AFTER INSERT ON ml_labels BEGIN
+  UPDATE ml_labels SET updated_seq = (SELECT COALESCE(MAX(updated_seq), 0) + 1 FROM ml_labels)
+  WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_ml_labels_seq_upd AFTER UPDATE OF label ON ml_labels BEGIN
+  UPDATE ml_labels SET updated_seq = (SELECT COALESCE(MAX(updated_seq), 0) + 1 FROM ml_labels)
+  WHERE rowid = NEW.rowid;
+END;
+"""
+
+def ensure_label_seq(conn: sqlite3.Connection) -> None:
+    """Add ml_labels.updated_seq and its triggers; existing rows start at their rowid."""
+    have = {r[1] for r in conn.execute("PRAGMA table_info(ml_labels)")}
+    if "updated_seq" not in have:
+        conn.execute("ALTER TABLE ml_labels ADD COLUMN updated_seq INTEGER")
+        conn.execute("UPDATE ml_labels SET updated_seq = rowid")
+    conn.executescript(_LABEL_SEQ_SQL)
+    conn.commit()
+
+# incremental-training bookkeeping, added to ml_models on first use
+_REGISTRY_COLUMNS = {
+    "label_hwm": "INTEGER",         # max ml_labels.updated_seq folded into this model
+    "correction_hwm": "INTEGER",    # max ml_corrections.id folded into this model
+    "mode": "TEXT",                 # full | incremental
+    "increments": "INTEGER NOT NULL DEFAULT 0",  # incremental updates since the last full fit
+}
+
+def ensure_registry_columns(conn: sqlite3.Connection) -> None:
+    have = {r[1] for r in conn.execute("PRAGMA table_info(ml_models)")}
+    for col, ddl in _REGISTRY_COLUMNS.items():
+        if col not in have:
+            conn.execute(f"ALTER TABLE ml_models ADD COLUMN {col} {ddl}")
+    conn.commit()
 
+def high_water_marks(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """Current (max ml_labels updated_seq, max ml_corrections id); 0 when a table is empty."""
+    ensure_label_seq(conn)
+    lab = conn.execute("SELECT COALESCE(MAX(updated_seq), 0) FROM ml_labels").fetchone()[0]
+    cor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ml_corrections").fetchone()[0]
+    return int(lab), int(cor)
+
+def registry_entry(conn: sqlite3.Connection, version: str) -> Optional[sqlite3.Row]:
+    ensure_registry_columns(conn)
+    return conn.execute("SELECT * FROM ml_models WHERE version=?", (version,)).fetchone()
+
+def collect_new_samples(conn: sqlite3.Connection, label_hwm: int,
+                        correction_hwm: int) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Samples labelled or corrected since the given high-water marks, with their
+    current human label: ml_labels rows inserted or relabelled since (updated_seq)
+    plus files with new ml_corrections.
+    """
+    ensure_label_seq(conn)
+    cur = conn.execute("""
+        SELECT s.file_hash, s.path, s.text, L.label AS human_label
+        FROM ml_labels AS L
+        JOIN ml_samples AS s ON s.file_hash = L.file_hash
+        WHERE L.updated_seq > ?
+           OR L.file_hash IN (SELECT file_hash FROM ml_corrections WHERE id > ?)
+    """, (label_hwm, correction_hwm))
+
+    texts: List[str] = []
+    labels: List[str] = []
+    hashes: List[str] = []
+    for r in cur:
+        txt = r["text"] or ""
+        if not txt:
+            pth = r["path"] or ""
+            txt = f"{os.path.basename(pth)} {os.path.basename(os.path.dirname(pth))}"
+        texts.append(normalize_text(txt))
+        labels.append(r["human_label"])
+        hashes.append(r["file_hash"])
     return texts, labels, hashes
 
 def upsert_model_registry(conn: sqlite3.Connection, version: str, path: str,
-                          accuracy: float, macro_f1: float, notes: str = "") -> None:
+                          accuracy: float, macro_f1: float, notes: str = "",
+                          label_hwm: Optional[int] = None, correction_hwm: Optional[int] = None,
+                          mode: str = "full", increments: int = 0) -> None:
+    ensure_registry_columns(conn)
     conn.execute("""
-        INSERT INTO ml_models(version, path, accuracy, macro_f1, notes)
-        VALUES(?,?,?,?,?)
+        INSERT INTO ml_models(version, path, accuracy, macro_f1, notes,
+                              label_hwm, correction_hwm, mode, increments)
+        VALUES(?,?,?,?,?,?,?,?,?)
         ON CONFLICT(version) DO UPDATE SET
           path=excluded.path, accuracy=excluded.accuracy,
-          macro_f1=excluded.macro_f1, notes=excluded.notes
-    """, (version, path, accuracy, macro_f1, notes))
+          macro_f1=excluded.macro_f1, notes=excluded.notes,
+          trained_at=CURRENT_TIMESTAMP, label_hwm=excluded.label_hwm,
+          correction_hwm=excluded.correction_hwm, mode=excluded.mode,
+          increments=excluded.increments
+    """, (version, path, accuracy, macro_f1, notes, label_hwm, correction_hwm, mode, increments))
     conn.commit()
@@ -0,0 +1,138 @@
+# nas_file_organizer/web/jobs.py
+from __future__ import annotations
+import os, threading, time, uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Optional
+
+CACHE_DB  = os.environ.get("CACHE_DB", "/data/cache.db")
+MODEL_OUT = os.environ.get("MODEL_OUT", "/data/model.pkl")
+MODEL_VER = os.environ.get("MODEL_VERSION", "tfidf-logreg-v1")
+
+# finished jobs kept for /api/jobs/{id}
+KEEP_FINISHED = 50
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    trigger: str                      # manual | scheduled | startup | api
+    status: str = "queued"            # queued | running | succeeded | failed
+    progress: str = ""
+    stats: dict = field(default_factory=dict)   # live counters for progress streams; set via update_stats()
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    coalesced: int = 0                # triggers folded into this job while it was active
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def update_stats(self, **changes: Any) -> dict:
+        """
+        Publish new counters. stats is replaced by a fresh dict, never mutated
+        in place, so a reader (to_dict on a request thread) always holds a
+        complete snapshot while the worker keeps counting.
+        """
+        with self._lock:
+            self.stats = {**self.stats, **changes}
+            return self.stats
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.init}
+
+
+class JobManager:
+    """
+    Background jobs on daemon threads, single-flight per kind: while a job of
+    a kind is queued or running, submitting that kind again returns the active
+    job (and counts the trigger as coalesced) instead of starting a second one.
+    """
+
+    def __init__(self, keep_finished: int = KEEP_FINISHED):
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: dict[str, Job] = {}
+        self.keep_finished = keep_finished
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], trigger: str = "manual") -> tuple[Job, bool]:
+        """Start fn(job) in the background. Returns (job, created); created is False when coalesced."""
+        with self._lock:
+            cur = self._active.get(kind)
+            if cur is not None:
+                cur.coalesced += 1
+                return cur, False
+            job = Job(id=uuid.uuid4().hex[:12], kind=kind, trigger=trigger)
+            self._jobs[job.id] = job
+            self._active[kind] = job
+            self._trim()
+        threading.Thread(target=self._run, args=(job, fn), name=f"job-{kind}-{job.id}", daemon=True).start()
+        return job, True
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        job.status, job.started_at = "running", time.time()
+        try:
+            res = fn(job)
+            job.result = res if isinstance(res, dict) else None
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.kind) is job:
+                    del self._active[job.kind]
+
+    def _trim(self) -> None:
+        done = [j for j in self._jobs.values() if not j.active]
+        for j in done[:max(0, len(done) - self.keep_finished)]:
+            del self._jobs[j.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Optional[Job]:
+        return self._active.get(kind)
+
+    def list(self) -> list[Job]:
+        return list(reversed(self._jobs.values()))
+
+
+jobs = JobManager()
+
+
+def _retrain_task(job: Job) -> dict:
+    from nas_file_organizer.ml.train import train_and_save
+    from nas_file_organizer.ml.holder import default_holder
+
+    def progress(msg: str) -> None:
+        job.progress = msg
+
+    try:
+        res = train_and_save(CACHE_DB, MODEL_OUT, MODEL_VER, progress=progress)
+    except Exception as e:
+        print(f"[AutoRetrain] Retrain failed [job {job.id}]:", e)
+        raise
+    print(f"[AutoRetrain] Model retrained ({res['samples']} samples, acc={res['accuracy']:.3f}, "
+          f"peak RSS {res['peak_rss_mb']} MiB) [job {job.id}, {job.trigger}]")
+    # swap the new model in now instead of waiting for the holder's next file check
+    job.progress = "reloading model"
+    holder = default_holder()
+    if holder.refresh():
+        print(f"[ModelReload] Now serving {holder.snapshot_stats()['version']}")
+    job.progress = "done"
+    return {k: v for k, v in res.items() if k != "report"}
+
+
+def start_retrain(trigger: str = "manual") -> tuple[Job, bool]:
+    """The one entry point for retraining (button, API, weekly schedule, startup)."""
+    job, created = jobs.submit("retrain", _retrain_task, trigger=trigger)
+    if not created:
+        print(f"[AutoRetrain] Retrain already {job.status} (job {job.id}); {trigger} trigger coalesced")
+    return job, created
@@ -0,0 +1,100 @@
+# nas_file_organizer/web/planner.py
+from __future__ import annotations
+import os, threading, time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from nas_file_organizer.core.models import Options, Result
+from nas_file_organizer.core.services import OrganizerService
+from nas_file_organizer.ml.holder import default_holder
+from nas_file_organizer.web.jobs import Job, jobs
+
+# how often the scheduler re-checks the inbox for new/changed/removed files
+PLAN_REFRESH_SECONDS = int(os.environ.get("PLAN_REFRESH_SECONDS", "60"))
+
+
+@dataclass
+class PlanSnapshot:
+    results: list[Result] = field(default_factory=list)
+    built_at: Optional[float] = None      # wall clock of the last completed refresh
+    duration_s: float = 0.0
+    basis: tuple = ()                     # (rules mtime, model version) the results were planned with
+    files: int = 0                        # inbox files seen by the last refresh
+    planned: int = 0                      # files (re)planned by the last refresh
+    reused: int = 0                       # files carried over unchanged
+    removed: int = 0
+
+    def age_seconds(self) -> Optional[float]:
+        return None if self.built_at is None else max(0.0, time.time() - self.built_at)
+
+
+class Planner:
+    """
+    Keeps the dashboard's plan as a snapshot instead of planning on every request.
+
+    refresh() stats the inbox and re-plans only files that are new or whose
+    size/mtime changed since the snapshot; unchanged files keep their previous
+    Result and vanished files are dropped. A change to rules.yaml or to the
+    served model version invalidates everything, as does full=True (the
+    dashboard's "Recompute" button). Refreshes run as the single-flight "plan"
+    job, so concurrent triggers coalesce into one pass.
+    """
+
+    def __init__(self, load_options: Callable[[], Options], rules_path: Path):
+        self.load_options = load_options
+        self.rules_path = Path(rules_path)
+        self.svc = OrganizerService()     # own instance: plan() resets per-run counters on the service
+        self._snap = PlanSnapshot()
+        self._sigs: dict[Path, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._full_pending = False        # a full recompute was requested while a refresh was running
+
+    def snapshot(self) -> PlanSnapshot:
+        return self._snap
+
+    def _basis(self) -> tuple:
+        try:
+            rules_mtime = self.rules_path.stat().st_mtime_ns
+        except OSError:
+            rules_mtime = None
+        return rules_mtime, default_holder().snapshot_stats()["version"]
+
+    def refresh(self, full: bool = False, job: Optional[Job] = None) -> dict:
+        with self._lock:
+            t0 = time.perf_counter()
+            opts = self.load_options()
+            basis = self._basis()
+            old = self._snap
+            full, self._full_pending = full or self._full_pending, False
+            if full or basis != old.basis:
+                self._sigs = {}
+            prev = {r.src: r for r in old.results} if self._sigs else {}
+
+            files = self.svc._scan(opts)
+            sigs = {p: (st.st_size, st.st_mtime_ns) for p, st in files}
+            todo = [(p, st) for p, st in files if p not in prev or self._sigs.get(p) != sigs[p]]
+            if job is not None:
+                job.progress = f"planning {len(todo)} of {len(files)} files"
+
+            fresh = {r.src: r for r in self.svc.plan_files(todo, opts)} if todo else {}
+            results = []
+            for p, _ in files:
+                r = fresh.get(p) or prev.get(p)
+                if r is not None:
+                    results.append(r)
+            removed = sum(1 for p in prev if p not in sigs)
+
+            self._sigs = sigs
+            self._snap = PlanSnapshot(results=results, built_at=time.time(),
+                                      duration_s=round(time.perf_counter() - t0, 3), basis=basis,
+                                      files=len(sigs), planned=len(todo), reused=len(results) - len(fresh), removed=removed)
+            return {"files": len(results), "planned": len(todo), "reused": self._snap.reused,
+                    "removed": removed, "duration_s": self._snap.duration_s}
+
+    def request_refresh(self, full: bool = False, trigger: str = "scheduled") -> tuple[Job, bool]:
+        """Run refresh() as the background "plan" job (coalesced if one is already active)."""
+        job, created = jobs.submit("plan", lambda job: self.refresh(full=full, job=job), trigger=trigger)
+        if full and not created:
+            self._full_pending = True
+        return job, created
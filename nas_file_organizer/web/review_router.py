@@ -3,9 +3,9 @@ from fastapi import APIRouter, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from nas_file_organizer.ml.train import train_and_save
 import os, sqlite3, shutil, hashlib, datetime
 from nas_file_organizer.web.metrics import latest_metrics, per_class_counts
+from nas_file_organizer.web.jobs import jobs, start_retrain
 
 
 APP_ROOT = Path(__file__).resolve().parents[2]
@@ -57,6 +57,7 @@ def review_page(request: Request, only_pending: int = 1):
         "archive_root": ARCHIVE_ROOT,
         "metrics": latest_metrics(),
         "class_counts": per_class_counts(),
+        "retrain_job": jobs.active("retrain") or jobs.get(request.query_params.get("retrain_job", "")),
     })
 
 @router.post("/submit", name="review_confirm")
@@ -85,13 +86,20 @@ def review_confirm(event_id: int = Form(...), label: str = Form(...), path: str
         # mark reviewed + chosen label on the file_events row
         con.execute("UPDATE file_events SET final_label=?, reviewed=1 WHERE id=?", (label, event_id))
 
-        # ensure ml_labels has a human label
-        file_hash = hashlib.sha256(str(src).encode("utf-8")).hexdigest()
+        # ensure ml_labels has a human label (samples may be keyed by content, not path)
+        row = con.execute("SELECT file_hash, predicted_label FROM ml_samples WHERE path=?", (str(src),)).fetchone()
+        file_hash = row["file_hash"] if row else hashlib.sha256(str(src).encode("utf-8")).hexdigest()
         con.execute("""
           INSERT INTO ml_labels(file_hash,label,source,created_at)
           VALUES(?,?,'human',?)
           ON CONFLICT(file_hash) DO UPDATE SET label=excluded.label
         """, (file_hash, label, datetime.datetime.utcnow().isoformat()))
+        # same rule as bulk assign; also lets incremental training see re-labelled files
+        if row and row["predicted_label"] and row["predicted_label"] != label:
+            con.execute("""
+              INSERT INTO ml_corrections(file_hash,predicted_label,corrected_label,created_at)
+              VALUES(?,?,?,CURRENT_TIMESTAMP)
+            """, (file_hash, row["predicted_label"], label))
 
         con.commit()
 
@@ -173,8 +181,8 @@ def create_label(name: str = Form(...)):
     # append_rule_stub(name)  # enable when you add the helper
     return RedirectResponse("/review", status_code=303)
 
-@router.post("/review/retrain", name="retrain_model")
+@router.post("/retrain", name="retrain_model")  # -> POST /review/retrain
 def review_retrain():
-    from nas_file_organizer.ml.train import train_and_save
-    train_and_save(CACHE_DB, MODEL_OUT, os.environ.get("MODEL_VERSION", "tfidf-logreg-v1"))
-    return RedirectResponse(url="/review?retrained=1", status_code=303)
\ No newline at end of file
+    # runs in the background; a second click while it runs joins the same job
+    job, _ = start_retrain("manual")
+    return RedirectResponse(url=f"/review?retrain_job={job.id}", status_code=303)
\ No newline at end of file
@@ -0,0 +1,15 @@
+import sqlite3
+
+import pytest
+
+from nas_file_organizer.db.migrate import FALLBACK_SQL
+
+
+@pytest.fixture
+def cache_db(tmp_path):
+    """Path to an empty cache DB with the embedded schema applied."""
+    path = tmp_path / "cache.db"
+    con = sqlite3.connect(path)
+    con.executescript(FALLBACK_SQL)
+    con.close()
+    return str(path)
@@ -0,0 +1,102 @@
+import sqlite3
+
+from nas_file_organizer.core import cache as cache_mod
+from nas_file_organizer.core.cache import TextCache
+
+
+def _fill(tmp_path, tc, n, text):
+    files = []
+    for i in range(n):
+        f = tmp_path / f"f{i}.txt"
+        f.write_text(str(i))
+        tc.set(f, text)
+        files.append(f)
+    return files
+
+
+def test_cap_ignores_other_tables_in_the_same_db(tmp_path, monkeypatch):
+    db = tmp_path / "cache.db"
+    monkeypatch.setattr(cache_mod, "MAX_DB_BYTES", 2 * 1024 * 1024)
+    monkeypatch.setattr(cache_mod, "COMPRESS", False)
+    # other tables sharing CACHE_DB, alone bigger than the text-cache cap
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE ml_samples (file_hash TEXT PRIMARY KEY, text TEXT)")
+    con.executemany("INSERT INTO ml_samples VALUES(?,?)", [(str(i), "x" * 10000) for i in range(400)])
+    con.commit()
+    con.close()
+
+    tc = TextCache(db)
+    files = _fill(tmp_path, tc, 400, "cached text " * 10)
+    assert tc.stats["db_evictions"] == 0
+    tc.gc()
+    assert tc.stats["db_evictions"] == 0
+    tc._lru.clear()
+    assert len(tc.get_many([(f, f.stat()) for f in files])) == 400
+
+
+def test_cap_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "MAX_DB_BYTES", 100 * 1024)
+    monkeypatch.setattr(cache_mod, "COMPRESS", False)
+    tc = TextCache(tmp_path / "cache.db")
+    files = _fill(tmp_path, tc, 400, "y" * 1024)   # ~400 KiB of payload
+    tc.gc()
+    con = tc._connect()
+    assert tc._payload_bytes(con) <= cache_mod.MAX_DB_BYTES
+    tc._lru.clear()
+    hits = tc.get_many([(f, f.stat()) for f in files])
+    assert files[-1] in hits and files[0] not in hits
+
+
+def test_content_keys_are_computed_outside_the_lock(tmp_path, monkeypatch):
+    tc = TextCache(tmp_path / "cache.db")
+    files = []
+    for i in range(3):
+        f = tmp_path / f"doc{i}.txt"
+        f.write_text(f"body {i}")
+        tc.set(f, f"text {i}", key_mode="content")
+        files.append(f)
+    tc._lru.clear()
+    tc._fps.clear()
+
+    real = cache_mod.content_fingerprint
+
+    def fingerprint(*a, **kw):
+        assert not tc._lock._is_owned(), "file hashed while holding the cache lock"
+        return real(*a, **kw)
+
+    monkeypatch.setattr(cache_mod, "content_fingerprint", fingerprint)
+    hits = tc.get_many([(f, f.stat()) for f in files[:2]], key_mode="content")
+    assert hits == {files[0]: "text 0", files[1]: "text 1"}
+    assert tc.get(files[2], key_mode="content") == "text 2"
+
+
+def test_gc_checks_files_outside_the_lock_and_leaves_the_full_vacuum_to_the_cli(tmp_path, monkeypatch):
+    tc = TextCache(tmp_path / "cache.db")
+    files = _fill(tmp_path, tc, 5, "some text")
+    files[0].unlink()
+    real = cache_mod.os.path.exists
+
+    def exists(p):
+        assert not tc._lock._is_owned(), "file checked while holding the cache lock"
+        return real(p)
+
+    monkeypatch.setattr(cache_mod.os.path, "exists", exists)
+    res = tc.gc()
+    assert res["pruned_missing"] == 1 and res["vacuum"].startswith("skipped")
+    assert tc._connect().execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+
+    res = tc.gc(full_vacuum=True)
+    assert res["vacuum"] == "full"
+    assert tc.gc()["vacuum"] == "incremental"
+
+
+def test_get_many_fills_every_copy_from_one_content_row(tmp_path):
+    tc = TextCache(tmp_path / "cache.db")
+    a, b = tmp_path / "a.pdf", tmp_path / "copy of a.pdf"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    tc.set(a, "extracted", key_mode="content")
+    tc._lru.clear()
+    hits = tc.get_many([(a, a.stat()), (b, b.stat())], key_mode="content")
+    assert hits == {a: "extracted", b: "extracted"}
+    assert tc.stats["hits"] == 2 and tc.stats["misses"] == 0
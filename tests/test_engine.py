@@ -0,0 +1,157 @@
+import random
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+from rapidfuzz import fuzz
+
+from nas_file_organizer.core import services
+from nas_file_organizer.core.engine import RuleEngine
+from nas_file_organizer.core.models import Rule, RuleAction, RuleMatch
+from nas_file_organizer.core.services import OrganizerService
+
+VOCAB = ("invoice total vat amount due payment contract party clause term signature "
+         "patient doctor blood tax return refund bank statement account ref no").split()
+PATTERNS = [r"\b\d{4}-\d{2}-\d{2}\b", r"Invoice\s+No", r"[A-Z]{2}\d{2}", r"total:\s*\d+", "(unclosed"]
+
+
+def reference_score(text: str, rule: Rule, title_n: int) -> Tuple[float, Optional[str]]:
+    """The per-rule scorer RuleEngine replaced, kept verbatim as the oracle."""
+    m = rule.match
+    lines = text.splitlines()
+    title = "\n".join(lines[:title_n])
+    body = "\n".join(lines[title_n:])
+    score = 0.0
+    first_kw: Optional[str] = None
+    if m.any_keywords:
+        for kw in m.any_keywords:
+            if kw.lower() in title.lower():
+                score += m.title_weight
+                if not first_kw: first_kw = kw
+            elif kw.lower() in body.lower():
+                score += m.body_weight
+                if not first_kw: first_kw = kw
+        if m.fuzzy_min:
+            best = max((fuzz.partial_ratio(kw.lower(), text.lower()) for kw in m.any_keywords), default=0)
+            if best >= m.fuzzy_min and not first_kw:
+                first_kw = m.any_keywords[0]
+                score += m.body_weight
+    for pat in m.patterns or ():
+        try:
+            if re.search(pat, text):
+                score += 2.0
+        except re.error:
+            pass
+    if m.regex:
+        try:
+            if re.search(m.regex, text, flags=re.IGNORECASE):
+                score += m.body_weight
+        except re.error:
+            pass
+    return score, first_kw
+
+
+def _keyword(rng: random.Random) -> str:
+    words = rng.sample(VOCAB, rng.choice([1, 1, 1, 2, 3]))
+    kw = " ".join(words)
+    if rng.random() < 0.2:
+        kw = kw[:rng.randint(1, len(kw))]           # prefixes and fragments overlap other keywords
+    return kw.upper() if rng.random() < 0.2 else kw
+
+
+def _rule(rng: random.Random, i: int) -> Rule:
+    return Rule(
+        name=f"r{i}",
+        match=RuleMatch(
+            any_keywords=[_keyword(rng) for _ in range(rng.randint(0, 4))] or None,
+            regex=rng.choice([None, None, r"amount\s+due", "ref no"]),
+            fuzzy_min=rng.choice([None, None, 80, 90]),
+            patterns=rng.sample(PATTERNS, rng.randint(0, 2)) or None,
+            title_weight=rng.choice([2.0, 3.0]),
+            body_weight=rng.choice([1.0, 0.5]),
+        ),
+        action=RuleAction(move_to="x"),
+    )
+
+
+def _text(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(0, 12)):
+        words = [rng.choice(VOCAB) for _ in range(rng.randint(0, 10))]
+        if rng.random() < 0.2:
+            words.append(rng.choice(["2024-01-31", "Invoice No", "DE44", "total: 12", "TOTAL"]))
+        if words and rng.random() < 0.1:
+            w = rng.randrange(len(words))      # a typo for the fuzzy pass
+            words[w] = words[w][:-1] + "x"
+        lines.append(" ".join(words).title() if rng.random() < 0.3 else " ".join(words))
+    return "\n".join(lines)
+
+
+def test_engine_matches_per_rule_scorer_on_random_rule_sets():
+    rng = random.Random(20240131)
+    for _ in range(200):
+        rules = [_rule(rng, i) for i in range(rng.randint(1, 8))]
+        engine = RuleEngine(rules)
+        for _ in range(5):
+            text, title_n = _text(rng), rng.randint(0, 5)
+            expected = [reference_score(text, r, title_n) for r in rules]
+            assert engine.score_text(text, title_n) == expected, (text, title_n, rules)
+
+
+def unpruned_classify(text: str, rules: list[Rule], title_n: int) -> Tuple[Optional[Rule], Optional[str]]:
+    """classify() without the max_score skips (rules only): score everything, then pick."""
+    engine = RuleEngine(rules)
+    scan = engine.scan(text, title_n)
+    best: tuple = (-1.0, -10 ** 9, None, None)
+    second: tuple = (-1.0, -10 ** 9, None, None)
+    for i, rule in enumerate(rules):
+        score, first_kw = engine.score(scan, i)
+        if score >= rule.match.min_score:
+            tup = (score, rule.match.priority, rule, first_kw)
+            if (score > best[0]) or (score == best[0] and rule.match.priority > best[1]):
+                best, second = tup, best
+            elif (score > second[0]) or (score == second[0] and rule.match.priority > second[1]):
+                second = tup
+    if not best[2] or (second[2] is not None and abs(best[0] - second[0]) < 0.25):
+        return None, None
+    return best[2], best[3]
+
+
+def _kw_rule(name: str, keywords: list[str], weight: float, min_score: int = 1) -> Rule:
+    return Rule(name=name, action=RuleAction(move_to="x"),
+                match=RuleMatch(any_keywords=keywords, title_weight=weight, body_weight=weight, min_score=min_score))
+
+
+def test_classify_pruning_keeps_near_tie_review(monkeypatch):
+    monkeypatch.setattr(services, "ML_MODE", "RULES_ONLY")
+    text = "Header\ninvoice total due"
+    rules = [
+        _kw_rule("b", ["total"], 1.2),
+        _kw_rule("a", ["invoice"], 1.0),
+        _kw_rule("c", ["due"], 1.0),               # bound 1.0 == runner-up, same priority: skipped
+        _kw_rule("d", ["invoice"], 1.0, min_score=5),  # can never reach min_score: skipped
+    ]
+    svc = OrganizerService()
+    assert svc.classify(Path("x.txt"), text, rules) == (None, None)   # 1.2 vs 1.0 is a near-tie
+    assert svc.classify(Path("x.txt"), text, rules) == unpruned_classify(text, rules, 5)
+    assert svc.rule_stats["pruned_bound"] == 2 and svc.rule_stats["pruned_min_score"] == 2
+
+    rules = [_kw_rule("b", ["total"], 1.5)] + rules[1:]     # clear winner now
+    assert svc.classify(Path("x.txt"), text, rules) == (rules[0], "total")
+
+
+def test_classify_pruning_matches_unpruned_scoring(monkeypatch):
+    monkeypatch.setattr(services, "ML_MODE", "RULES_ONLY")
+    rng = random.Random(7)
+    svc = OrganizerService()
+    outcomes = set()
+    for _ in range(300):
+        rules = [_kw_rule(f"r{i}", [rng.choice(VOCAB) for _ in range(rng.randint(1, 2))],
+                          rng.choice([1.0, 1.1, 1.2, 1.25, 1.5]), min_score=rng.choice([0, 1, 1, 2, 5]))
+                 for i in range(rng.randint(2, 6))]
+        text = _text(rng)
+        got = svc.classify(Path("x.txt"), text, rules)
+        assert got == unpruned_classify(text, rules, 5), (text, rules)
+        outcomes.add(got[0] is None)
+    assert outcomes == {True, False}
+    assert svc.rule_stats["pruned_bound"] and svc.rule_stats["pruned_min_score"]
@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from nas_file_organizer.core import cache as cache_mod
+from nas_file_organizer.core import services
+from nas_file_organizer.core.cache import TextCache
+from nas_file_organizer.core.models import Options
+from nas_file_organizer.core.services import OrganizerService
+
+
+def plain_extract(path: Path, kwargs: dict) -> str:
+    # pool workers start clean, so they can't see the test's cache; read the file directly
+    return path.read_text(encoding="utf-8")
+
+
+class RecordingPool(ProcessPoolExecutor):
+    last = None
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        RecordingPool.last = self
+        self.procs: list = []
+        self.shutdown_kw = None
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.procs = list((self._processes or {}).values())
+        self.shutdown_kw = {"wait": wait, "cancel_futures": cancel_futures}
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+@pytest.fixture
+def inbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "_default", TextCache(tmp_path / "cache.db"))
+    monkeypatch.setattr(services, "extract_one", plain_extract)
+    monkeypatch.setattr(services, "ProcessPoolExecutor", RecordingPool)
+    root = tmp_path / "inbox"
+    root.mkdir()
+    for name, text in (("b.txt", "second file\n" * 50), ("a.txt", "first file\n")):
+        (root / name).write_text(text, encoding="utf-8")
+    return root
+
+
+def _files(inbox):
+    return [(p, p.stat()) for p in (inbox / "b.txt", inbox / "a.txt")]
+
+
+def test_pool_extract_keeps_scan_order_and_matches_inline(inbox, tmp_path):
+    svc = OrganizerService()
+    opts = Options(inbox=inbox, archive_root=tmp_path / "out", rules=[], workers=2)
+    pooled = list(svc._extract(_files(inbox), opts))
+    assert RecordingPool.last is not None and RecordingPool.last.shutdown_kw is not None
+
+    cache_mod._default = TextCache(tmp_path / "inline.db")
+    opts.workers = 1
+    assert pooled == list(svc._extract(_files(inbox), opts))
+    assert [p.name for p, _ in pooled] == ["b.txt", "a.txt"]
+
+
+def test_pool_shuts_down_when_consumer_stops_early(inbox, tmp_path):
+    RecordingPool.last = None
+    opts = Options(inbox=inbox, archive_root=tmp_path / "out", rules=[], workers=2)
+    gen = OrganizerService()._extract(_files(inbox), opts)
+    assert next(gen)[0].name == "b.txt"
+    gen.close()
+    pool = RecordingPool.last
+    assert pool.shutdown_kw == {"wait": True, "cancel_futures": True}
+    assert pool.procs and not any(p.is_alive() for p in pool.procs)
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+from nas_file_organizer.ml.feature_store import FeatureStore
+from nas_file_organizer.ml.utils import collect_training_set
+
+
+def _sample(con, fh, text, path, label="invoices"):
+    con.execute("INSERT OR REPLACE INTO ml_samples(file_hash, path, text, updated_at) VALUES(?,?,?,'2024-01-01')",
+                (fh, path, text))
+    con.execute("INSERT OR REPLACE INTO ml_labels(file_hash, label) VALUES(?,?)", (fh, label))
+
+
+def test_sync_tracks_content_and_training_filter(cache_db):
+    con = sqlite3.connect(cache_db)
+    _sample(con, "a", "invoice total due", "/in/a.pdf")
+    _sample(con, "b", "", "/in/b.pdf")          # no text: built from the path
+    _sample(con, "c", "", "")                   # neither: never a training row
+    con.commit()
+    fs = FeatureStore(con, n_features=2 ** 12)
+    assert fs.sync() == {"built": 2, "deleted": 0}
+    assert fs.sync()["built"] == 0
+
+    # same length and same updated_at, different text: still rebuilt
+    _sample(con, "a", "invoice total off", "/in/a.pdf")
+    con.commit()
+    assert fs.sync()["built"] == 1
+
+    # a sample that stops being usable loses its row
+    _sample(con, "b", "", "")
+    con.commit()
+    assert fs.sync() == {"built": 0, "deleted": 1}
+
+    con.row_factory = sqlite3.Row
+    _, _, hashes = fs.training_matrix()
+    assert hashes == collect_training_set(con)[2] == ["a"]
+
+
+def test_sync_hashes_only_rows_whose_marker_moved(cache_db, monkeypatch):
+    from nas_file_organizer.ml import feature_store as fs_mod
+
+    con = sqlite3.connect(cache_db)
+    for i in range(20):
+        _sample(con, f"h{i}", f"invoice {i}", f"/in/{i}.pdf")
+    con.commit()
+    fs = FeatureStore(con, n_features=2 ** 12)
+    fs.sync()
+
+    hashed = []
+    real = fs_mod._feature_sig
+    monkeypatch.setattr(fs_mod, "_feature_sig", lambda t, p: hashed.append(p) or real(t, p))
+    assert fs.sync()["built"] == 0 and hashed == []
+
+    # touched (e.g. moved by the review UI) but same text: hashed, not rebuilt
+    con.execute("UPDATE ml_samples SET updated_at='2024-02-01' WHERE file_hash='h3'")
+    con.commit()
+    assert fs.sync()["built"] == 0 and hashed == ["/in/3.pdf"]
+    assert fs.sync()["built"] == 0 and len(hashed) == 1
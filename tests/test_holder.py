@@ -0,0 +1,38 @@
+import os
+import threading
+
+import joblib
+
+from nas_file_organizer.ml.holder import ModelHolder
+
+
+def test_one_load_per_change_and_readers_keep_the_old_generation(tmp_path, monkeypatch):
+    path = tmp_path / "model.pkl"
+    joblib.dump({"pipeline": "v1"}, path)
+    holder = ModelHolder(str(path), check_seconds=0)
+    assert holder.current().pipeline == "v1"
+
+    joblib.dump({"pipeline": "v2"}, path)
+    os.utime(path, ns=(1, 1))               # make sure the signature moves
+    loading, release = threading.Event(), threading.Event()
+    loads = []
+    real = joblib.load
+
+    def slow_load(*a, **kw):
+        loads.append(1)
+        loading.set()
+        release.wait(10)
+        return real(*a, **kw)
+
+    monkeypatch.setattr(joblib, "load", slow_load)
+    loader = threading.Thread(target=holder.current)
+    loader.start()
+    assert loading.wait(10)
+    # every other caller returns at once with the generation being served
+    readers = [holder.current() for _ in range(20)]
+    assert {m.pipeline for m in readers} == {"v1"}
+    release.set()
+    loader.join(10)
+
+    assert holder.current().pipeline == "v2"
+    assert len(loads) == 1 and holder.stats["reloads"] == 1
@@ -0,0 +1,30 @@
+import json
+import threading
+
+from nas_file_organizer.web.jobs import Job
+
+
+def test_to_dict_reads_a_consistent_snapshot_while_stats_change():
+    job = Job(id="j1", kind="execute", trigger="test")
+    job.update_stats(done=0, recent_errors=[])
+    stop = threading.Event()
+
+    def worker():
+        st = dict(job.stats)
+        while not stop.is_set():
+            st["done"] += 1
+            st[f"k{st['done'] % 50}"] = st["done"]      # keys come and go, as with per-run counters
+            st["recent_errors"] = (st["recent_errors"] + [st["done"]])[-20:]
+            job.update_stats(**st)
+
+    t = threading.Thread(target=worker)
+    t.start()
+    try:
+        for _ in range(2000):
+            snap = job.to_dict()["stats"]
+            json.dumps(snap)
+            assert len(snap["recent_errors"]) <= 20
+    finally:
+        stop.set()
+        t.join()
+    assert job.to_dict()["stats"]["done"] == job.stats["done"]
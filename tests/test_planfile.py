@@ -0,0 +1,26 @@
+
+from nas_file_organizer.core.models import Result
+from nas_file_organizer.core.planfile import (
+    plan_mismatches,
+    read_plan,
+    read_plan_header,
+    save_plan,
+)
+
+
+def test_plan_header_records_inbox_and_rules(tmp_path):
+    inbox, other = tmp_path / "inbox", tmp_path / "other"
+    inbox.mkdir(); other.mkdir()
+    rules = tmp_path / "rules.yaml"
+    rules.write_text("rules: []\n")
+    plan = tmp_path / "plan.jsonl"
+    res = Result(src=inbox / "a.txt", dst=tmp_path / "out" / "a.txt", rule="r", ok=True)
+    assert save_plan([res], plan, inbox, rules) == 1
+
+    header = read_plan_header(plan)
+    assert plan_mismatches(header, inbox, rules) == []
+    assert [r.src for r in read_plan(plan)] == [res.src]
+
+    assert any("inbox" in p for p in plan_mismatches(header, other, rules))
+    rules.write_text("rules: [{name: x}]\n")
+    assert any("rules" in p for p in plan_mismatches(header, inbox, rules))
@@ -0,0 +1,63 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from nas_file_organizer.core import runs
+from nas_file_organizer.core.models import Result
+from nas_file_organizer.core.runs import LeaseLost, RunCoordinator, exclusive_run
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch, tmp_path):
+    monkeypatch.setattr(runs, "POLL_SECONDS", 0.02)
+    monkeypatch.setattr(runs, "CACHE_DB", str(tmp_path / "cache.db"))
+
+
+def _results(n):
+    return (Result(src=Path(f"/in/{i}"), dst=Path(f"/out/{i}"), rule="r", ok=True) for i in range(n))
+
+
+def test_expired_lease_is_taken_over_and_old_holder_stops(tmp_path):
+    db = str(tmp_path / "cache.db")
+    stalled = RunCoordinator(tmp_path, db, lease_seconds=0.1)
+    a = stalled.start("cli")       # no keep_alive: behaves like a hung process
+    assert a.active
+    time.sleep(0.15)
+
+    b = RunCoordinator(tmp_path, db, lease_seconds=0.1).start("web", wait=False)
+    assert b.active
+    statuses = {h["id"]: h["status"] for h in stalled.history()}
+    assert statuses[a.id] == "abandoned" and statuses[b.id] == "running"
+
+    assert stalled.heartbeat(a) is False and a.lease_lost
+    moved = []
+    with pytest.raises(LeaseLost):
+        for r in stalled.track(a, _results(3)):
+            moved.append(r)
+    assert moved == []
+
+
+def test_keep_alive_holds_the_lease_through_a_long_quiet_stretch(tmp_path, monkeypatch):
+    monkeypatch.setattr(runs, "LEASE_SECONDS", 0.3)
+    with exclusive_run(tmp_path, "web") as (coord, run):
+        assert run.active
+        time.sleep(1.0)            # e.g. OCR-heavy planning before the first result
+        other = RunCoordinator(tmp_path, coord.db_path, lease_seconds=0.3).start("cli", wait=False)
+        assert other.status == "busy"
+        assert [r.src.name for r in coord.track(run, _results(2))] == ["0", "1"]
+    assert {h["id"]: h["status"] for h in coord.history()}[run.id] == "succeeded"
+
+
+def test_whole_inbox_requests_merge_into_a_queued_run(tmp_path):
+    db = str(tmp_path / "cache.db")
+    holder = RunCoordinator(tmp_path, db).start("cli")
+    waiting = threading.Thread(target=lambda: RunCoordinator(tmp_path, db).start("web"))
+    waiting.start()
+    time.sleep(0.1)
+    merged = RunCoordinator(tmp_path, db).start("watch-rescan", wait=False)
+    assert merged.status == "merged" and merged.merged_into
+    RunCoordinator(tmp_path, db).finish(holder)
+    waiting.join(timeout=5)
+    assert not waiting.is_alive()
@@ -0,0 +1,25 @@
+import sqlite3
+import time
+
+from nas_file_organizer.core.samples import SampleWriter
+
+
+def test_close_writes_pending_rows_and_counts_drops(tmp_path):
+    db = str(tmp_path / "cache.db")
+    w = SampleWriter(db, batch_rows=2, flush_ms=60_000, queue_max=100)
+    for i in range(5):
+        assert w.add(f"h{i}", f"/in/{i}.pdf", f"text {i}", "invoice", 0.5 + i / 10)
+
+    t0 = time.monotonic()
+    w.close()
+    assert time.monotonic() - t0 < 10     # the trailing partial batch doesn't wait out flush_ms
+    assert not w._thread.is_alive()
+
+    rows = sqlite3.connect(db).execute(
+        "SELECT file_hash, path, text, predicted_label FROM ml_samples ORDER BY file_hash").fetchall()
+    assert rows == [(f"h{i}", f"/in/{i}.pdf", f"text {i}", "invoice") for i in range(5)]
+
+    assert w.add("late", "/in/late.pdf", "x", "invoice", 0.9) is False
+    stats = w.snapshot_stats()
+    assert (stats["queued"], stats["written"], stats["dropped"], stats["failed"]) == (5, 5, 1, 0)
+    assert stats["pending"] == 0
@@ -0,0 +1,48 @@
+import os
+
+from nas_file_organizer.core.scan import InboxScanner
+
+
+def _age_dir(path, seconds=60):
+    # push the directory mtime out of the racy window so the next scan may skip listing it
+    t = os.stat(path).st_mtime - seconds
+    os.utime(path, (t, t))
+
+
+def test_rewrite_in_place_is_seen_in_skipped_dir(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    f = inbox / "note.txt"
+    f.write_text("hello one")
+    _age_dir(inbox)
+    scanner = InboxScanner(inbox, db_path=str(tmp_path / "cache.db"))
+    first = scanner.scan()
+    assert first.files[f].st_size == len("hello one")
+
+    dir_mtime = os.stat(inbox).st_mtime_ns
+    f.write_text("Invoice number 42, total 100.00 EUR")
+    assert os.stat(inbox).st_mtime_ns == dir_mtime   # in-place rewrite leaves the dir alone
+
+    second = scanner.scan()
+    assert second.dirs_skipped == 1 and second.dirs_listed == 0
+    assert second.files[f].st_size == f.stat().st_size
+    assert second.files[f].st_mtime_ns == f.stat().st_mtime_ns
+    assert second.changed == [f]
+
+
+def test_new_and_removed_files(tmp_path):
+    inbox = tmp_path / "inbox"
+    (inbox / "sub").mkdir(parents=True)
+    a, b = inbox / "a.txt", inbox / "sub" / "b.txt"
+    a.write_text("a")
+    b.write_text("b")
+    scanner = InboxScanner(inbox, db_path=str(tmp_path / "cache.db"))
+    assert set(scanner.scan().files) == {a, b}
+
+    a.unlink()
+    c = inbox / "sub" / "c.txt"
+    c.write_text("c")
+    res = scanner.scan()
+    assert set(res.files) == {b, c}
+    assert res.added == [c]
+    assert res.removed == [a]
@@ -0,0 +1,80 @@
+import random
+import sqlite3
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+from nas_file_organizer.ml.train import train_and_save
+
+WORDS = {
+    "invoices": "invoice total vat amount due payment subtotal".split(),
+    "contracts": "agreement party clause term signature contract".split(),
+    "medical": "patient doctor diagnosis prescription clinic blood".split(),
+}
+
+
+def _add_samples(db, start, n, seed):
+    rng = random.Random(seed)
+    con = sqlite3.connect(db)
+    for i in range(start, start + n):
+        label = list(WORDS)[i % len(WORDS)]
+        text = " ".join(rng.choice(WORDS[label]) for _ in range(30))
+        fh = f"h{i:05d}"
+        con.execute("INSERT INTO ml_samples(file_hash, path, text) VALUES(?,?,?)", (fh, f"/in/{fh}.txt", text))
+        con.execute("INSERT INTO ml_labels(file_hash, label) VALUES(?,?)", (fh, label))
+    con.commit()
+    con.close()
+
+
+def test_full_then_incremental_round_trip(cache_db, tmp_path):
+    out = str(tmp_path / "model.pkl")
+    _add_samples(cache_db, 0, 300, seed=1)
+    full = train_and_save(cache_db, out, "v-test", incremental=True)
+    assert full["mode"] == "full" and full["format"] == "online"
+
+    _add_samples(cache_db, 300, 40, seed=2)
+    inc = train_and_save(cache_db, out, "v-test", incremental=True)
+    assert inc["mode"] == "incremental"
+    assert inc["samples"] == 40
+    assert inc["accuracy"] > 0.9
+
+    # nothing new: the update is a no-op rather than a refit
+    again = train_and_save(cache_db, out, "v-test", incremental=True)
+    assert again["mode"] == "incremental" and again["samples"] == 0
+
+
+def test_compact_matches_pipeline():
+    import numpy as np
+
+    from nas_file_organizer.ml.compact import CompactClassifier
+    from nas_file_organizer.ml.train import build_pipeline
+
+    rng = random.Random(3)
+    labels = [list(WORDS)[i % len(WORDS)] for i in range(120)]
+    texts = [" ".join(rng.choice(WORDS[lb] + WORDS["contracts"]) for _ in range(30)) for lb in labels]
+    pipe = build_pipeline("compact").fit(texts[:100], labels[:100])
+    probe = texts[100:] + ["unseen words only", ""]
+
+    exact = CompactClassifier.from_pipeline(pipe, min_weight=0.0)
+    assert np.allclose(exact.decision_function(probe), pipe.decision_function(probe), atol=1e-5)
+    pruned = CompactClassifier.from_pipeline(pipe, min_weight=0.05)
+    assert len(pruned.features) < len(exact.features)
+    assert pruned.predict(probe[:20]) == list(pipe.predict(probe[:20]))
+
+
+def test_incremental_sees_relabels_that_keep_the_row(cache_db, tmp_path):
+    out = str(tmp_path / "model.pkl")
+    _add_samples(cache_db, 0, 300, seed=1)
+    train_and_save(cache_db, out, "v-test", incremental=True)
+
+    # the review UI's upsert: same row and rowid, no ml_corrections entry (no prediction stored)
+    con = sqlite3.connect(cache_db)
+    con.execute("""
+      INSERT INTO ml_labels(file_hash, label) VALUES('h00000', 'contracts')
+      ON CONFLICT(file_hash) DO UPDATE SET label=excluded.label
+    """)
+    con.commit()
+    con.close()
+    inc = train_and_save(cache_db, out, "v-test", incremental=True)
+    assert inc["mode"] == "incremental" and inc["samples"] == 1
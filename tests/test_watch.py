@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("watchdog")
+
+from nas_file_organizer.adapters import watch
+from nas_file_organizer.core.models import Result
+from nas_file_organizer.core.runs import LeaseLost
+
+
+class _Coord:
+    def track(self, run, results):
+        yield from results
+
+
+@contextmanager
+def _fake_run(*a, **kw):
+    yield _Coord(), None
+
+
+def _handler(tmp_path, monkeypatch, fail):
+    monkeypatch.setattr(watch, "exclusive_run", _fake_run)
+    h = watch.DebouncedHandler(tmp_path / "rules.yaml")
+    monkeypatch.setattr(h, "options", lambda: type("O", (), {"inbox": tmp_path})())
+    files = []
+    for name in ("a.txt", "b.txt"):
+        f = tmp_path / name
+        f.write_text(name)
+        files.append(f)
+        st = f.stat()
+        h.pending[f] = watch.Pending(first_seen=0.0, last_event=0.0,   # settled long ago
+                                     sig=(st.st_size, st.st_mtime_ns), stable=watch.STABLE_TICKS)
+
+    def process_paths(paths, opts):
+        yield Result(src=paths[0], dst=None, rule=None, ok=True)
+        raise fail
+
+    monkeypatch.setattr(h.svc, "process_paths", process_paths)
+    return h, files
+
+
+@pytest.mark.parametrize("fail", [LeaseLost("taken over"), OSError("disk gone")])
+def test_unprocessed_files_go_back_to_pending(tmp_path, monkeypatch, fail):
+    h, files = _handler(tmp_path, monkeypatch, fail)
+    h.flush_ready()            # must not raise: the watcher loop survives a bad batch
+    assert set(h.pending) == {files[1]}
+    assert h.pending[files[1]].stable == 0